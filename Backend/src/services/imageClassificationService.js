@@ -11,6 +11,10 @@ import path from "path";
 
 // ML API Configuration
 const ML_API_URL = process.env.ML_API_URL || "http://localhost:8001";
+// Overloaded /predict calls fall back to the ML API's job queue, long-polled
+// in steps of ML_JOB_POLL_SECONDS for at most ML_JOB_MAX_WAIT_MS
+const ML_JOB_POLL_SECONDS = Number(process.env.ML_JOB_POLL_SECONDS || 25);
+const ML_JOB_MAX_WAIT_MS = Number(process.env.ML_JOB_MAX_WAIT_MS || 300000);
 
 // Department mapping for categories
 const DEPARTMENT_MAP = {
@@ -34,6 +38,69 @@ const DEPARTMENT_MAP = {
   ILLEGAL_PARKING: "Traffic Police Department",
 };
 
+/**
+ * Build a multipart form holding one image
+ * @param {string} imagePath - Local path or http(s) URL
+ * @returns {FormData} Form with the image in the "file" field
+ */
+async function buildImageForm(imagePath) {
+  const form = new FormData();
+
+  // Handle different input types
+  if (imagePath.startsWith("http")) {
+    // Remote URL - fetch and send
+    const response = await axios.get(imagePath, {
+      responseType: "arraybuffer",
+    });
+    form.append("file", Buffer.from(response.data), {
+      filename: "image.jpg",
+      contentType: "image/jpeg",
+    });
+  } else {
+    // Local file path
+    const absolutePath = path.isAbsolute(imagePath)
+      ? imagePath
+      : path.join(process.cwd(), imagePath);
+    form.append("file", fs.createReadStream(absolutePath));
+  }
+  return form;
+}
+
+/**
+ * Whether a failed /predict call should be retried through the job queue
+ * (timed out, or the ML API is overloaded or still loading its model)
+ */
+function shouldQueue(error) {
+  return error.code === "ECONNABORTED" || error.response?.status === 503;
+}
+
+/**
+ * Classify an image through the ML API's async job queue
+ * Submits the image, then long-polls /jobs/{id} until it finishes
+ * @param {string} imagePath - Path to the image file
+ * @returns {Object} The /predict-shaped result
+ */
+async function classifyViaJob(imagePath) {
+  const form = await buildImageForm(imagePath);
+  const submitted = await axios.post(`${ML_API_URL}/jobs`, form, {
+    headers: form.getHeaders(),
+    timeout: 30000,
+  });
+  const jobId = submitted.data.job_id;
+  console.log(`🕒 [ImageClassification] Queued as ML job ${jobId}`);
+
+  const deadline = Date.now() + ML_JOB_MAX_WAIT_MS;
+  while (Date.now() < deadline) {
+    const { data: job } = await axios.get(`${ML_API_URL}/jobs/${jobId}`, {
+      params: { wait: ML_JOB_POLL_SECONDS },
+      timeout: (ML_JOB_POLL_SECONDS + 10) * 1000,
+    });
+    if (job.status === "done") return job.result;
+    if (job.status === "failed") throw new Error(job.error || "Classification job failed");
+  }
+  throw new Error(`ML job ${jobId} did not finish in time`);
+}
+
 /**
  * Classify an image using the ML model
  * @param {string} imagePath - Path to the image file
@@ -41,40 +108,30 @@ const DEPARTMENT_MAP = {
  */
 async function classifyIssueImage(imagePath) {
   try {
-    const form = new FormData();
-
-    // Handle different input types
-    if (imagePath.startsWith("http")) {
-      // Remote URL - fetch and send
-      const response = await axios.get(imagePath, {
-        responseType: "arraybuffer",
-      });
-      form.append("file", Buffer.from(response.data), {
-        filename: "image.jpg",
-        contentType: "image/jpeg",
-      });
-    } else {
-      // Local file path
-      const absolutePath = path.isAbsolute(imagePath)
-        ? imagePath
-        : path.join(process.cwd(), imagePath);
-      form.append("file", fs.createReadStream(absolutePath));
-    }
+    const form = await buildImageForm(imagePath);
 
     console.log(
       `🤖 [ImageClassification] Sending to ML API: ${ML_API_URL}/predict`
     );
 
-    const response = await axios.post(`${ML_API_URL}/predict`, form, {
-      headers: form.getHeaders(),
-      timeout: 30000,
-    });
-
-    if (!response.data.success) {
-      throw new Error(response.data.detail || "Classification failed");
+    let result;
+    try {
+      const response = await axios.post(`${ML_API_URL}/predict`, form, {
+        headers: form.getHeaders(),
+        timeout: 30000,
+      });
+      result = response.data;
+    } catch (error) {
+      if (!shouldQueue(error)) throw error;
+      console.warn(
+        `⚠️ [ImageClassification] /predict unavailable (${error.message}), using the job queue`
+      );
+      result = await classifyViaJob(imagePath);
     }
 
-    const result = response.data;
+    if (!result.success) {
+      throw new Error(result.detail || "Classification failed");
+    }
 
     console.log(`✅ [ImageClassification] Result:`, {
       category: result.category,
@@ -143,6 +200,74 @@ async function classifyMultipleImages(imagePaths) {
   };
 }
 
+/**
+ * Classify many images with a single request to the ML batch endpoint
+ * Remote URLs are fetched by the ML service, which must allow their host
+ * with ML_BATCH_URL_PREFIXES; local files are uploaded.
+ * @param {string[]} imagePaths - Array of image paths or URLs
+ * @returns {Object[]} One result per image, in input order
+ */
+async function classifyImagesBatch(imagePaths) {
+  const form = new FormData();
+  const sources = [];
+  const order = [];
+
+  // The ML service numbers uploaded files first, then sources
+  imagePaths.forEach((imagePath, i) => {
+    if (!imagePath.startsWith("http")) {
+      const absolutePath = path.isAbsolute(imagePath)
+        ? imagePath
+        : path.join(process.cwd(), imagePath);
+      form.append("files", fs.createReadStream(absolutePath));
+      order.push(i);
+    }
+  });
+  imagePaths.forEach((imagePath, i) => {
+    if (imagePath.startsWith("http")) {
+      sources.push(imagePath);
+      order.push(i);
+    }
+  });
+  if (sources.length > 0) {
+    form.append("sources", JSON.stringify(sources));
+  }
+
+  console.log(
+    `🤖 [ImageClassification] Sending ${imagePaths.length} images to ML API: ${ML_API_URL}/predict/batch`
+  );
+
+  const response = await axios.post(`${ML_API_URL}/predict/batch`, form, {
+    headers: form.getHeaders(),
+    responseType: "text",
+    timeout: 0,
+  });
+
+  const results = new Array(imagePaths.length);
+  for (const line of response.data.split("\n")) {
+    if (!line.trim()) continue;
+    const item = JSON.parse(line);
+    const target = order[item.index];
+    results[target] = item.success
+      ? {
+          success: true,
+          data: {
+            category: item.legacy_category || item.category.toLowerCase(),
+            originalCategory: item.category,
+            categoryName: item.category_name,
+            description: item.description,
+            confidence: item.confidence,
+            department: item.department,
+            priority: item.priority,
+            allPredictions: item.all_predictions || [],
+            source: "ml_model",
+          },
+        }
+      : { success: false, error: item.error };
+  }
+
+  return results;
+}
+
 /**
  * Get department for a category
  * @param {string} category - Category name
@@ -202,7 +327,9 @@ async function getCategories() {
 
 export const imageClassificationService = {
   classifyIssueImage,
+  classifyViaJob,
   classifyMultipleImages,
+  classifyImagesBatch,
   getDepartmentForCategory,
   checkHealth,
   getCategories,
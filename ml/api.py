@@ -3,17 +3,43 @@ Urban Issues Classification API
 FastAPI service for classifying civic issue images using trained PyTorch CNN model
 """
 
-from fastapi import FastAPI, UploadFile, HTTPException, File
-from fastapi.middleware.cors import CORSMiddleware
+import time
+IMPORT_STARTED = time.perf_counter()
+
+# torch (and the numpy it loads) is most of the import cost; it is needed at
+# module level for DEVICE and the model code, so it is timed on its own
 import torch
-import torch.nn as nn
-from torchvision import transforms, models
-import numpy as np
-from PIL import Image
+TORCH_IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+from fastapi import FastAPI, UploadFile, HTTPException, File, Form, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import io
 import json
 import os
-import io
-from typing import Optional
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from batcher import MicroBatcher, QueueFullError
+from metrics import Registry, format_timing_header, read_process_memory
+from cascade import TTA_MODES, cascade_predict, warm_up_cascade
+from classifier import (
+    BACKENDS, EMBEDDING_DIM, IMG_SIZE, CivicIssueClassifier, OnnxRuntimeModel, backend_device, find_weights_path,
+    load_classifier, load_embedder
+)
+from feature_cache import weights_fingerprint
+from ingest import RequestBodyLimit, UploadRejected, inspect_upload
+from job_queue import FINISHED, QUEUED, JobStore
+from vector_index import VectorIndex
+from prediction_cache import PredictionCache, content_hash, perceptual_hash
+from preprocessing import Preprocessor
+from model_registry import (
+    CanaryCheckError, CategoryTable, ModelRegistry, ModelSlot, check_canary, load_canary_set, warm_up
+)
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
 
 app = FastAPI(
     title="Urban Issues Classifier API",
@@ -21,6 +47,23 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Upload limits: images over ML_MAX_UPLOAD_BYTES or ML_MAX_IMAGE_PIXELS, or
+# without an image signature, are rejected before they are decoded. Request
+# bodies are capped per route while they stream in, before multipart parsing
+# spools them (uploads over 1 MB are spooled to disk, not held in memory).
+MAX_UPLOAD_BYTES = int(os.getenv("ML_MAX_UPLOAD_BYTES", str(10 * 2**20)))
+MAX_IMAGE_PIXELS = int(os.getenv("ML_MAX_IMAGE_PIXELS", "60000000"))
+MAX_BATCH_REQUEST_BYTES = int(os.getenv("ML_MAX_BATCH_REQUEST_BYTES", str(256 * 2**20)))
+# Room for form fields and multipart boundaries around a single image
+MULTIPART_OVERHEAD = 64 * 1024
+app.add_middleware(RequestBodyLimit, limits={
+    "/predict": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+    "/embed": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+    "/similar": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+    "/predict/batch": MAX_BATCH_REQUEST_BYTES,
+    "/jobs": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+})
+
 # Enable CORS for frontend integration
 app.add_middleware(
     CORSMiddleware,
@@ -33,9 +76,142 @@ app.add_middleware(
 # Global variables for model and mappings
 model = None
 class_mappings = None
-IMG_SIZE = 224
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# Inference backend: eager, torchscript, onnxruntime, quantized (see export.py)
+# or student (the distilled model from train.py --distill)
+MODEL_BACKEND = os.getenv("ML_MODEL_BACKEND", "eager").lower()
+model_device = DEVICE
+
+# Versioned model slots; /reload checks new versions against labelled canary
+# images in ML_CANARY_DIR/<class>/ before swapping them in
+model_slots = ModelRegistry()
+reload_task = None
+CANARY_DIR = os.getenv("ML_CANARY_DIR", "model/canary")
+CANARY_MIN_ACCURACY = float(os.getenv("ML_CANARY_MIN_ACCURACY", "0.5"))
+
+# Cascade: a cheap first stage (ML_CASCADE_BACKEND, e.g. student or quantized, and/or a
+# smaller ML_CASCADE_IMG_SIZE) answers images it is at least
+# ML_CASCADE_THRESHOLD (0-1) confident about; the rest are escalated to the
+# full model, averaged over ML_TTA views (none, flip or multicrop). Without a
+# cascade backend every image goes to the full model, with TTA if set.
+CASCADE_BACKEND = os.getenv("ML_CASCADE_BACKEND", "").lower() or None
+CASCADE_IMG_SIZE = int(os.getenv("ML_CASCADE_IMG_SIZE", str(IMG_SIZE)))
+CASCADE_THRESHOLD = float(os.getenv("ML_CASCADE_THRESHOLD", "0.8"))
+TTA_MODE = os.getenv("ML_TTA", "none").lower()
+
+# Startup: the model loads in the background so liveness and cheap endpoints
+# answer at once and readiness flips once it is warm (ML_LAZY_LOAD=false
+# blocks startup instead). Readiness later than the budget is logged.
+LAZY_LOAD = os.getenv("ML_LAZY_LOAD", "true").lower() in ("1", "true", "yes")
+COLD_START_BUDGET_SECONDS = float(os.getenv("ML_COLD_START_BUDGET_SECONDS", "15"))
+startup_timings = {"import": round(IMPORT_SECONDS, 3), "import_torch": round(TORCH_IMPORT_SECONDS, 3)}
+model_load_task = None
+
+# Micro-batching configuration (concurrent /predict calls share one forward pass)
+MAX_BATCH_SIZE = int(os.getenv("ML_MAX_BATCH_SIZE", "16"))
+MAX_BATCH_WAIT_MS = float(os.getenv("ML_MAX_BATCH_WAIT_MS", "5"))
+MAX_QUEUE_SIZE = int(os.getenv("ML_MAX_QUEUE_SIZE", "256"))
+batcher = None
+embed_batcher = None
+
+# Bounded worker pool for CPU-bound decode, preprocessing and forward passes,
+# so the event loop stays free for cheap endpoints like /health and /categories
+INFERENCE_WORKERS = max(1, int(os.getenv("ML_INFERENCE_WORKERS", "2")))
+TORCH_THREADS = max(1, int(os.getenv(
+    "ML_TORCH_THREADS", str(max(1, (os.cpu_count() or 1) // INFERENCE_WORKERS))
+)))
+executor = None
+
+# Set by run_server.py for each forked worker in production mode
+WORKER_ID = os.getenv("ML_WORKER_ID")
+# Set by run_server.py once it has loaded the model in the parent before forking
+PRELOADED = False
+
+# Shared preprocessing pipeline, built once (ML_JPEG_DRAFT=false forces full decodes)
+preprocessor = Preprocessor(use_draft=os.getenv("ML_JPEG_DRAFT", "true").lower() in ("1", "true", "yes"))
+
+# Prediction cache for repeat uploads (ML_CACHE_MAX_ENTRIES=0 disables it)
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv("ML_CACHE_MAX_ENTRIES", "2048")),
+    ttl_seconds=float(os.getenv("ML_CACHE_TTL_SECONDS", "3600")),
+    use_perceptual=os.getenv("ML_CACHE_PERCEPTUAL", "false").lower() in ("1", "true", "yes")
+)
+
+# Embedding index for near-duplicate report detection (/embed, /similar)
+INDEX_DIR = os.getenv("ML_INDEX_DIR", "data/vector_index")
+SIMILAR_MAX_K = int(os.getenv("ML_SIMILAR_MAX_K", "50"))
+vector_index = None
+
+# Asynchronous jobs (/jobs): submitted images are persisted in SQLite under
+# ML_JOBS_DIR and drained by a background task that claims up to
+# ML_JOB_BATCH_SIZE jobs at a time and feeds them through the shared
+# micro-batching queue. Results are kept for ML_JOB_TTL_SECONDS.
+JOBS_DIR = os.getenv("ML_JOBS_DIR", "data/jobs")
+JOB_BATCH_SIZE = int(os.getenv("ML_JOB_BATCH_SIZE", str(MAX_BATCH_SIZE * INFERENCE_WORKERS)))
+JOB_MAX_PENDING = int(os.getenv("ML_JOB_MAX_PENDING", "10000"))
+JOB_POLL_INTERVAL = float(os.getenv("ML_JOB_POLL_INTERVAL", "0.5"))
+JOB_MAX_WAIT = float(os.getenv("ML_JOB_MAX_WAIT", "30"))
+JOB_LEASE_SECONDS = float(os.getenv("ML_JOB_LEASE_SECONDS", "120"))
+JOB_TTL_SECONDS = float(os.getenv("ML_JOB_TTL_SECONDS", "86400"))
+job_store = None
+job_drain_task = None
+# Set when a job is submitted; replaced after each drained batch so long-polls wake up
+job_submitted = None
+job_finished = None
+
+# Response shaping: ranked predictions returned by default (?top_k= overrides)
+DEFAULT_TOP_K = int(os.getenv("ML_DEFAULT_TOP_K", "5"))
+
+# Bulk classification (/predict/batch) limits
+BATCH_MAX_ITEMS = int(os.getenv("ML_BATCH_MAX_ITEMS", "1000"))
+BATCH_URL_TIMEOUT = float(os.getenv("ML_BATCH_URL_TIMEOUT", "15"))
+# URLs are only fetched if they start with one of these comma-separated
+# prefixes (include the path slash, e.g. https://res.cloudinary.com/); unset
+# disables URL sources, so callers cannot make the server fetch internal URLs
+BATCH_URL_PREFIXES = tuple(
+    prefix.strip() for prefix in os.getenv("ML_BATCH_URL_PREFIXES", "").split(",") if prefix.strip()
+)
+url_client = None
+# Local paths are only readable below this directory; unset disables them
+BATCH_LOCAL_ROOT = os.getenv("ML_BATCH_LOCAL_ROOT")
+
+# Prometheus-style metrics served at /metrics; per-stage timings are also
+# returned in an X-Timing header unless ML_TIMING_HEADER=false
+TIMING_HEADER = os.getenv("ML_TIMING_HEADER", "true").lower() in ("1", "true", "yes")
+registry = Registry()
+STAGE_SECONDS = registry.histogram(
+    "ml_stage_duration_seconds", "Time spent per request in each pipeline stage", ["stage"]
+)
+REQUEST_SECONDS = registry.histogram(
+    "ml_request_duration_seconds", "End-to-end request latency", ["path"]
+)
+REQUESTS_TOTAL = registry.counter(
+    "ml_requests_total", "Requests by route and status code", ["path", "status"]
+)
+PREDICTIONS_TOTAL = registry.counter(
+    "ml_predictions_total", "Predictions by top category", ["category"]
+)
+BATCH_SIZE = registry.histogram(
+    "ml_batch_size", "Images per forward pass", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+CASCADE_IMAGES = registry.counter(
+    "ml_cascade_images_total", "Images answered by each cascade stage", ["stage"]
+)
+INFLIGHT_REQUESTS = registry.gauge("ml_inflight_requests", "Requests currently being handled")
+registry.gauge("ml_queue_depth", "Images waiting in the inference queue",
+               getter=lambda: batcher.queue_depth if batcher else 0)
+registry.counter("ml_cache_hits_total", "Prediction cache content-hash hits",
+                 getter=lambda: prediction_cache.hits)
+registry.counter("ml_cache_perceptual_hits_total", "Prediction cache perceptual-hash hits",
+                 getter=lambda: prediction_cache.perceptual_hits)
+registry.counter("ml_cache_misses_total", "Prediction cache misses",
+                 getter=lambda: prediction_cache.misses)
+registry.gauge("ml_process_resident_memory_bytes", "Resident memory of this worker process",
+               getter=lambda: (read_process_memory() or {}).get("rss", 0))
+registry.gauge("ml_process_proportional_memory_bytes", "PSS of this worker (shared pages split between workers)",
+               getter=lambda: (read_process_memory() or {}).get("pss", 0))
+
 # Category descriptions for user-friendly output
 CATEGORY_DESCRIPTIONS = {
     "ROAD_POTHOLE": "Road damage including potholes and cracks",
@@ -63,73 +239,445 @@ LEGACY_CATEGORY_MAP = {
 }
 
 
-class CivicIssueClassifier(nn.Module):
-    """CNN model for civic issue classification using transfer learning"""
-    
-    def __init__(self, num_classes):
-        super(CivicIssueClassifier, self).__init__()
-        self.backbone = models.resnet18(weights=None)
-        num_features = self.backbone.fc.in_features
-        self.backbone.fc = nn.Sequential(
-            nn.Dropout(0.5),
-            nn.Linear(num_features, 256),
-            nn.ReLU(),
-            nn.Dropout(0.3),
-            nn.Linear(256, num_classes)
-        )
+def load_mappings():
+    """Load class mappings from disk, or None if they are missing"""
+    mappings_path = "model/class_mappings.json"
+    if not os.path.exists(mappings_path):
+        print("⚠️ Class mappings not found, using defaults")
+        return None
+    with open(mappings_path, "r") as f:
+        mappings = json.load(f)
+    print("✅ Class mappings loaded successfully")
+    return mappings
+
+
+def prepare_model_slot(backend):
+    """
+    Load, warm up and canary-check a new model version without activating it.
     
-    def forward(self, x):
-        return self.backbone(x)
+    Raises FileNotFoundError if the model artifact is missing and
+    CanaryCheckError if the new model fails warm-up or the canary set.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}', expected one of {BACKENDS}")
+    mappings = load_mappings()
+    num_classes = mappings.get("num_classes", 9) if mappings else 9
+    loaded_model, model_path = load_classifier(backend, num_classes, DEVICE, num_threads=TORCH_THREADS)
+    slot = ModelSlot(
+        model_slots.next_version(), loaded_model, mappings, backend,
+        backend_device(backend, DEVICE), model_path
+    )
+    slot.categories = CategoryTable(mappings, num_classes, CATEGORY_DESCRIPTIONS, LEGACY_CATEGORY_MAP)
+    print(f"📦 Loaded {backend} model {slot.version} from {model_path}")
+    if isinstance(loaded_model, CivicIssueClassifier):
+        slot.embedder, slot.embedder_id = loaded_model, weights_fingerprint(model_path)
+    if TTA_MODE not in TTA_MODES:
+        raise ValueError(f"Unknown ML_TTA mode '{TTA_MODE}', expected one of {TTA_MODES}")
+    if CASCADE_BACKEND is not None:
+        attach_fast_model(slot, num_classes)
+    warm_up(slot)
+    warm_up_cascade(slot, CASCADE_IMG_SIZE, TTA_MODE)
+    canary = load_canary_set(CANARY_DIR, mappings, lambda contents: preprocessor(contents)[0])
+    check_canary(slot, canary, CANARY_MIN_ACCURACY)
+    return slot
+
+
+def attach_fast_model(slot, num_classes):
+    """Give `slot` its cascade first stage, sharing the full model when the backend matches"""
+    if CASCADE_BACKEND == slot.backend:
+        if CASCADE_IMG_SIZE >= IMG_SIZE:
+            print(f"⚠️ Cascade stage is the full model at full resolution, set ML_CASCADE_IMG_SIZE below {IMG_SIZE}")
+        slot.fast_model, slot.fast_device = slot.model, slot.device
+    else:
+        slot.fast_model, fast_path = load_classifier(CASCADE_BACKEND, num_classes, DEVICE, num_threads=TORCH_THREADS)
+        slot.fast_device = backend_device(CASCADE_BACKEND, DEVICE)
+        print(f"📦 Loaded {CASCADE_BACKEND} cascade model from {fast_path}")
+    if isinstance(slot.fast_model, OnnxRuntimeModel):
+        height, width = slot.fast_model.input_shape[2:]
+        if isinstance(height, int) and isinstance(width, int) and (height, width) != (CASCADE_IMG_SIZE, CASCADE_IMG_SIZE):
+            raise ValueError(
+                f"ONNX model was exported for {height}x{width} inputs, so ML_CASCADE_IMG_SIZE="
+                f"{CASCADE_IMG_SIZE} cannot run on it; re-export with export.py"
+            )
+    slot.fast_backend = CASCADE_BACKEND
+    print(f"🪜 Cascade: {CASCADE_BACKEND} at {CASCADE_IMG_SIZE}px, escalating below "
+          f"{CASCADE_THRESHOLD:.0%} confidence (TTA: {TTA_MODE})")
+
+
+def use_model_slot(slot):
+    """Point the module-level model globals at `slot` and drop cached predictions"""
+    global model, class_mappings, model_device
+    model, class_mappings, model_device = slot.model, slot.class_mappings, slot.device
+    prediction_cache.clear()
 
 
-def get_transform():
-    """Get image transform for inference"""
-    return transforms.Compose([
-        transforms.Resize((IMG_SIZE, IMG_SIZE)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
+def activate_model_slot(slot):
+    """Atomically switch new requests to `slot`, keeping the old one for rollback"""
+    model_slots.activate(slot)
+    use_model_slot(slot)
+    print(f"✅ Model {slot.version} active on {slot.device}")
 
 
 def load_model_and_mappings():
-    """Load the trained model and class mappings"""
-    global model, class_mappings
+    """Load the trained model and class mappings and make them active"""
+    global class_mappings
+    try:
+        activate_model_slot(prepare_model_slot(MODEL_BACKEND))
+    except (FileNotFoundError, ValueError, CanaryCheckError) as e:
+        model_slots.last_error = str(e)
+        print(f"⚠️ Model not loaded: {e}")
+        if model_slots.active is None:
+            class_mappings = load_mappings()
+
+
+def mark_ready(load_seconds=None):
+    """Record time-to-ready for a startup model load and check it against the budget"""
+    if load_seconds is not None:
+        startup_timings["model_load"] = round(load_seconds, 3)
+    if model_slots.active is None:
+        return
+    ready = time.perf_counter() - IMPORT_STARTED
+    startup_timings["warmup"] = round(model_slots.active.warmup_ms / 1000.0, 3)
+    startup_timings["ready"] = round(ready, 3)
+    if ready > COLD_START_BUDGET_SECONDS:
+        print(f"⚠️ Ready after {ready:.1f}s, over the {COLD_START_BUDGET_SECONDS:.0f}s cold-start budget")
+    else:
+        print(f"✅ Ready after {ready:.1f}s (budget {COLD_START_BUDGET_SECONDS:.0f}s)")
+
+
+def load_startup_model():
+    """Load the configured model at startup, timing it for the readiness report"""
+    start = time.perf_counter()
+    load_model_and_mappings()
+    mark_ready(time.perf_counter() - start)
+
+
+async def load_model_in_background():
+    """Lazy startup load; nothing awaits this task, so failures are reported via /health/ready"""
+    try:
+        await run_in_executor(load_startup_model)
+    except Exception as e:
+        model_slots.last_error = f"{type(e).__name__}: {e}"
+        print(f"❌ Model not loaded: {model_slots.last_error}")
+    finally:
+        model_slots.loading = None
+
+
+embedder_lock = threading.Lock()
+
+
+def get_embedder(slot):
+    """
+    Embedding model for `slot`.
     
-    model_path = "model/civic_classifier.pth"
-    mappings_path = "model/class_mappings.json"
+    Eager slots embed with their own model; exported backends load the eager
+    weights on first use, so startup does not pay for a second model.
+    Raises FileNotFoundError if there are no eager weights.
+    """
+    with embedder_lock:
+        if slot.embedder is None:
+            slot.embedder = load_embedder(slot.model, slot.num_classes, DEVICE)
+            slot.embedder_id = weights_fingerprint(find_weights_path())
+            print(f"📦 Loaded embedding model for {slot.version}")
+    return slot.embedder
+
+
+def init_worker():
+    """Limit intra-op threads so workers do not oversubscribe the CPU"""
+    torch.set_num_threads(TORCH_THREADS)
+
+
+def decode_and_preprocess(contents, with_phash=False):
+    """Decode raw image bytes into the normalized (C, H, W) tensor, optional perceptual hash and stage timings"""
+    return preprocessor(contents, perceptual_hash if with_phash else None)
+
+
+async def run_in_executor(func, *args):
+    """Run a blocking function on the inference worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
+
+def run_inference(batch):
+    """
+    Run one forward pass over a stacked batch on the active model version.
     
-    # Check for best model first
-    best_model_path = "model/civic_classifier_best.pth"
-    if os.path.exists(best_model_path):
-        model_path = best_model_path
+    Returns one ((probabilities, class_indices), slot) pair per image, with
+    every class ranked by probability, so callers know which version
+    produced their result even if a swap happens mid-flight. With a cascade
+    only the uncertain images of the batch reach the full model.
+    """
+    slot = model_slots.active
+    if slot is None:
+        raise RuntimeError("Model not loaded")
+    with torch.no_grad():
+        probabilities, escalated = cascade_predict(slot, batch, CASCADE_THRESHOLD, CASCADE_IMG_SIZE, TTA_MODE)
+        # Rank once per batch; responses slice plain lists instead of sorting per request
+        values, indices = torch.topk(probabilities, k=probabilities.shape[1], dim=1)
+    full = int(escalated.sum())
+    CASCADE_IMAGES.inc(len(batch) - full, stage="fast")
+    CASCADE_IMAGES.inc(full, stage="full")
+    return [(ranked, slot) for ranked in zip(values.tolist(), indices.tolist())]
+
+
+def run_embedding(batch):
+    """Unit-normalized backbone features for a stacked batch, one (row, slot) pair per image"""
+    slot = model_slots.active
+    if slot is None:
+        raise RuntimeError("Model not loaded")
+    embedder = get_embedder(slot)
+    device = next(embedder.parameters()).device
+    with torch.no_grad():
+        features = embedder.embed(batch.to(device))
+        features = torch.nn.functional.normalize(features.float(), dim=1).cpu()
+    return [(row, slot) for row in features]
+
+
+def build_prediction(ranked, slot, top_k=DEFAULT_TOP_K, min_confidence=None, compact=False):
+    """
+    Build the /predict response body from one ranked prediction.
     
-    # Load mappings first to get num_classes
-    if os.path.exists(mappings_path):
-        with open(mappings_path, "r") as f:
-            class_mappings = json.load(f)
-        print("✅ Class mappings loaded successfully")
-        num_classes = class_mappings.get("num_classes", 9)
-    else:
-        print("⚠️ Class mappings not found, using defaults")
-        class_mappings = None
-        num_classes = 9
+    `all_predictions` holds the `top_k` best classes, dropping those below
+    `min_confidence` (percent). The compact form keeps only the top class
+    and [class_index, confidence] pairs; category details come from /categories.
+    """
+    probabilities, class_indices = ranked
+    table = slot.categories
+    class_index = class_indices[0]
+    confidence = round(probabilities[0] * 100, 2)
+    top = [
+        (idx, prob * 100) for prob, idx in zip(probabilities[:top_k], class_indices[:top_k])
+        if min_confidence is None or prob * 100 >= min_confidence
+    ]
     
-    if os.path.exists(model_path):
-        print(f"📦 Loading model from {model_path}")
-        model = CivicIssueClassifier(num_classes)
-        model.load_state_dict(torch.load(model_path, map_location=DEVICE))
-        model.to(DEVICE)
-        model.eval()
-        print(f"✅ Model loaded successfully on {DEVICE}")
-    else:
-        print(f"⚠️ Model not found at {model_path}")
-        model = None
+    if compact:
+        return {
+            "success": True,
+            "class_index": class_index,
+            "category": table.metadata[class_index]["category"],
+            "confidence": confidence,
+            "all_predictions": [[idx, round(value, 2)] for idx, value in top],
+            "model_version": slot.version
+        }
+    return {
+        "success": True,
+        "class_index": class_index,
+        **table.metadata[class_index],
+        "confidence": confidence,
+        "all_predictions": [
+            {"category": table.labels[idx], "confidence": value} for idx, value in top
+        ] if table.has_mappings else [],
+        "model_version": slot.version
+    }
+
+
+def record_batch(batch_size, forward_seconds):
+    """Batcher callback: track the size of every forward pass"""
+    BATCH_SIZE.observe(batch_size)
+
+
+def record_timings(timings):
+    """Feed one request's stage timings (seconds) into the stage histogram"""
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+async def read_upload(upload):
+    """
+    Validate an upload where it was spooled and return (file, sha256) for classify_bytes.
+    
+    Raises UploadRejected for oversized, non-image or too-large-to-decode files.
+    """
+    sha, _ = await asyncio.to_thread(inspect_upload, upload.file, MAX_UPLOAD_BYTES, MAX_IMAGE_PIXELS)
+    return upload.file, sha
+
+
+async def classify_bytes(contents, timings=None, options=None, sha=None):
+    """
+    Classify raw image bytes, serving repeat uploads from the prediction cache.
+    
+    `contents` may also be a seekable file holding the bytes, in which case
+    its precomputed `sha` (hex SHA-256) must be given. If a `timings` dict is given it is filled with seconds spent per stage
+    (decode, transform, queue, forward, response). `options` are passed to
+    build_prediction (top_k, min_confidence, compact). The cache holds the
+    ranked probabilities, so every response shape can be served from it.
+    """
+    timings = {} if timings is None else timings
+    options = options or {}
+    if not prediction_cache.enabled:
+        sha = None
+    elif sha is None:
+        sha = content_hash(contents)
+    cached = prediction_cache.get(sha) if sha is not None else None
+    
+    phash = None
+    if cached is None:
+        with_phash = prediction_cache.enabled and prediction_cache.use_perceptual
+        img_tensor, phash, prep = await run_in_executor(decode_and_preprocess, contents, with_phash)
+        timings["decode"] = prep["decode"]
+        timings["transform"] = prep["resize"] + prep["tensor"]
+        if phash is not None:
+            cached = prediction_cache.get_perceptual(phash, sha)
+    
+    if cached is not None:
+        result = {**build_prediction(*cached, **options), "cached": True}
+        PREDICTIONS_TOTAL.inc(category=result["category"])
+        return result
+    
+    generation = prediction_cache.generation
+    ranked, slot = await batcher.submit(img_tensor, timings)
+    start = time.perf_counter()
+    result = build_prediction(ranked, slot, **options)
+    timings["response"] = time.perf_counter() - start
+    prediction_cache.put((ranked, slot), sha=sha, phash=phash, generation=generation)
+    PREDICTIONS_TOTAL.inc(category=result["category"])
+    return result
+
+
+async def embed_bytes(contents):
+    """Decode raw image bytes (or a seekable file) and return (embedding as numpy, slot) via the embedding queue"""
+    img_tensor, _, _ = await run_in_executor(decode_and_preprocess, contents)
+    embedding, slot = await embed_batcher.submit(img_tensor)
+    return embedding.numpy(), slot
+
+
+def open_job_store():
+    global job_store
+    job_store = JobStore(JOBS_DIR, lease_seconds=JOB_LEASE_SECONDS, ttl_seconds=JOB_TTL_SECONDS)
+    purged = job_store.purge()
+    print(f"✅ Job queue at {JOBS_DIR} ({job_store.pending()} pending, {purged} expired removed)")
+
+
+async def run_job(job_id, path, sha, options):
+    """Classify one stored job image; returns (job_id, result, error), or None to requeue it"""
+    try:
+        with open(path, "rb") as f:
+            return job_id, await classify_bytes(f, options=options, sha=sha), None
+    except QueueFullError:
+        return None
+    except Exception as e:
+        return job_id, None, f"{type(e).__name__}: {e}"
+
+
+async def drain_jobs():
+    """
+    Background task: claim queued jobs in batches and classify them.
+    
+    All claimed jobs are submitted at once, so they fill whole forward passes
+    in the micro-batching queue. Idle, it waits for a local submission or
+    the poll interval (jobs may be submitted to another worker process).
+    """
+    global job_finished
+    last_purge = time.monotonic()
+    while True:
+        jobs = []
+        if model_slots.active is not None:
+            try:
+                jobs = await asyncio.to_thread(job_store.claim, JOB_BATCH_SIZE)
+            except Exception as e:
+                print(f"⚠️ Could not claim jobs: {e}")
+        if not jobs:
+            if time.monotonic() - last_purge > 3600:
+                last_purge = time.monotonic()
+                try:
+                    await asyncio.to_thread(job_store.purge)
+                except Exception as e:
+                    print(f"⚠️ Could not purge expired jobs: {e}")
+            job_submitted.clear()
+            try:
+                await asyncio.wait_for(job_submitted.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        outcomes = await asyncio.gather(*(run_job(*job) for job in jobs))
+        requeue = [job[0] for job, outcome in zip(jobs, outcomes) if outcome is None]
+        # Jobs that cannot be recorded keep their lease and are claimed again once it expires
+        try:
+            await asyncio.to_thread(job_store.finish, [outcome for outcome in outcomes if outcome is not None])
+        except Exception as e:
+            print(f"⚠️ Could not record finished jobs: {e}")
+        if requeue:
+            try:
+                await asyncio.to_thread(job_store.release, requeue)
+            except Exception as e:
+                print(f"⚠️ Could not requeue jobs: {e}")
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+        finished, job_finished = job_finished, asyncio.Event()
+        finished.set()
+
+
+def open_vector_index():
+    global vector_index
+    vector_index = VectorIndex(INDEX_DIR, EMBEDDING_DIM)
+    print(f"✅ Vector index at {INDEX_DIR} ({len(vector_index)} items)")
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Load model on startup"""
-    load_model_and_mappings()
+    """Start the worker pool and inference queues, then load the model"""
+    global batcher, embed_batcher, executor, class_mappings, model_load_task
+    global job_drain_task, job_submitted, job_finished, url_client
+    init_worker()
+    executor = ThreadPoolExecutor(
+        max_workers=INFERENCE_WORKERS,
+        thread_name_prefix="inference",
+        initializer=init_worker
+    )
+    # Cheap state first, so /, /categories and liveness work during the model load
+    if class_mappings is None:
+        class_mappings = load_mappings()
+    await run_in_executor(open_vector_index)
+    batcher, embed_batcher = (
+        MicroBatcher(
+            infer_fn,
+            max_batch_size=MAX_BATCH_SIZE,
+            max_wait_ms=MAX_BATCH_WAIT_MS,
+            max_queue_size=MAX_QUEUE_SIZE,
+            executor=executor,
+            max_concurrent_batches=INFERENCE_WORKERS,
+            on_batch=record_batch
+        )
+        for infer_fn in (run_inference, run_embedding)
+    )
+    batcher.start()
+    embed_batcher.start()
+    await asyncio.to_thread(open_job_store)
+    # Only batch URL fetches use httpx, so its import is kept out of module load
+    import httpx
+    url_client = httpx.AsyncClient(timeout=BATCH_URL_TIMEOUT, follow_redirects=False)
+    job_submitted, job_finished = asyncio.Event(), asyncio.Event()
+    job_drain_task = asyncio.create_task(drain_jobs())
+    
+    if PRELOADED and model_slots.active is not None:
+        # Preloaded in the parent by run_server.py before forking; warm up
+        # this worker's thread pool before it starts accepting connections
+        await run_in_executor(warm_up, model_slots.active)
+        await run_in_executor(warm_up_cascade, model_slots.active, CASCADE_IMG_SIZE, TTA_MODE)
+        print(f"✅ Worker {WORKER_ID} warmed up model {model_version()} in {model_slots.active.warmup_ms} ms")
+        mark_ready()
+    elif LAZY_LOAD:
+        model_slots.loading = MODEL_BACKEND
+        model_load_task = asyncio.create_task(load_model_in_background())
+    else:
+        await run_in_executor(load_startup_model)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the inference queue and worker pool"""
+    if job_drain_task is not None:
+        # Jobs still in flight keep their lease and are claimed again after a restart
+        job_drain_task.cancel()
+    for queue in (batcher, embed_batcher):
+        if queue is not None:
+            await queue.stop()
+    if vector_index is not None:
+        vector_index.flush()
+    if url_client is not None:
+        await url_client.aclose()
+    if executor is not None:
+        executor.shutdown(wait=False)
 
 
 @app.get("/")
@@ -140,27 +688,138 @@ async def root():
         "service": "Urban Issues Classifier API",
         "model_loaded": model is not None,
         "mappings_loaded": class_mappings is not None,
-        "device": str(DEVICE)
+        "device": str(model_device)
     }
 
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up and serving, whether or not the model is loaded"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: 200 once a model is loaded and warmed up, 503 while loading or after a failure"""
+    if model_slots.active is None:
+        status = "loading" if model_slots.loading is not None else "failed"
+        return JSONResponse(
+            status_code=503,
+            content={"status": status, "error": model_slots.last_error, "startup": startup_timings}
+        )
+    return {"status": "ready", "model_version": model_version(), "startup": startup_timings}
+
+
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
+    # Index and job stats touch disk (flock, SQLite), so they stay off the event loop
+    index_stats, job_stats = await asyncio.gather(
+        asyncio.to_thread(vector_index.stats) if vector_index else asyncio.sleep(0),
+        asyncio.to_thread(job_store.stats) if job_store else asyncio.sleep(0)
+    )
     return {
         "status": "healthy" if model is not None else "degraded",
         "model_loaded": model is not None,
         "mappings_loaded": class_mappings is not None,
-        "device": str(DEVICE),
-        "categories": list(CATEGORY_DESCRIPTIONS.keys()) if class_mappings else []
+        "device": str(model_device),
+        "backend": model_slots.active.backend if model_slots.active else MODEL_BACKEND,
+        "model_version": model_version(),
+        "loading": model_slots.loading,
+        "startup": startup_timings,
+        "categories": list(CATEGORY_DESCRIPTIONS.keys()) if class_mappings else [],
+        "batching": {
+            "max_batch_size": MAX_BATCH_SIZE,
+            "max_wait_ms": MAX_BATCH_WAIT_MS,
+            "max_queue_size": MAX_QUEUE_SIZE,
+            "queue_depth": batcher.queue_depth if batcher else 0
+        },
+        "cascade": {
+            "backend": CASCADE_BACKEND,
+            "img_size": CASCADE_IMG_SIZE,
+            "threshold": CASCADE_THRESHOLD,
+            "tta": TTA_MODE
+        },
+        "workers": {
+            "inference_workers": INFERENCE_WORKERS,
+            "torch_threads": TORCH_THREADS
+        },
+        "process": {
+            "pid": os.getpid(),
+            "worker_id": WORKER_ID,
+            "memory_mb": {
+                key: round(value / 2**20, 1) for key, value in (read_process_memory() or {}).items()
+            }
+        },
+        "uploads": {
+            "max_upload_bytes": MAX_UPLOAD_BYTES,
+            "max_image_pixels": MAX_IMAGE_PIXELS,
+            "max_batch_request_bytes": MAX_BATCH_REQUEST_BYTES
+        },
+        "cache": prediction_cache.stats(),
+        "preprocessing": preprocessor.stats(),
+        "vector_index": index_stats,
+        "jobs": job_stats
     }
 
 
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Count requests by route and status and track in-flight requests"""
+    start = time.perf_counter()
+    INFLIGHT_REQUESTS.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        INFLIGHT_REQUESTS.dec()
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        REQUESTS_TOTAL.inc(path=path, status=status)
+        REQUEST_SECONDS.observe(time.perf_counter() - start, path=path)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of service metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def require_model():
+    if model is None:
+        if model_slots.loading is not None:
+            raise HTTPException(status_code=503, detail="Model is still loading", headers={"Retry-After": "1"})
+        raise HTTPException(status_code=503, detail="Model not loaded. Please train the model first.")
+
+
+def response_options(top_k, min_confidence, compact):
+    """Validate the response-shaping query parameters shared by the predict endpoints"""
+    if top_k < 0:
+        raise HTTPException(status_code=400, detail="top_k must be >= 0")
+    if min_confidence is not None and not 0 <= min_confidence <= 100:
+        raise HTTPException(status_code=400, detail="min_confidence must be between 0 and 100")
+    return {"top_k": top_k, "min_confidence": min_confidence, "compact": compact}
+
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(
+    response: Response,
+    file: UploadFile = File(...),
+    top_k: int = DEFAULT_TOP_K,
+    min_confidence: Optional[float] = None,
+    compact: bool = False
+):
     """
     Classify an uploaded image of a civic issue
     
+    Query parameters:
+        - top_k: Number of ranked predictions in all_predictions (default 5)
+        - min_confidence: Drop ranked predictions below this confidence (0-100)
+        - compact: Return only class_index, category, confidence and
+          [class_index, confidence] pairs; details are in /categories
+    
     Returns:
         - class_index: Numeric class index
         - category: Standardized category code
@@ -170,63 +829,29 @@ async def predict(file: UploadFile = File(...)):
         - department: Suggested department to handle the issue
         - priority: Suggested priority level
         - legacy_category: Backend-compatible category
-        - all_predictions: Confidence scores for all categories
+        - all_predictions: Confidence scores for the top categories
     """
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded. Please train the model first.")
+    require_model()
+    options = response_options(top_k, min_confidence, compact)
     
     try:
-        # Read and decode image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
-        
-        # Preprocess image
-        transform = get_transform()
-        img_tensor = transform(image).unsqueeze(0).to(DEVICE)
-        
-        # Make prediction
-        with torch.no_grad():
-            outputs = model(img_tensor)
-            probabilities = torch.softmax(outputs, dim=1)[0]
-            class_index = int(torch.argmax(probabilities))
-            confidence = float(probabilities[class_index]) * 100
-        
-        # Get category info from mappings
-        if class_mappings and "index_to_category" in class_mappings:
-            category_info = class_mappings["index_to_category"].get(str(class_index), {})
-            category = category_info.get("category", "UNKNOWN")
-            original_name = category_info.get("original_name", "Unknown")
-            department = category_info.get("department", "General Municipal Department")
-            priority = category_info.get("priority", "medium")
-        else:
-            category = "UNKNOWN"
-            original_name = "Unknown"
-            department = "General Municipal Department"
-            priority = "medium"
-        
-        # Build all predictions list
-        all_predictions = []
-        if class_mappings and "index_to_category" in class_mappings:
-            for idx, prob in enumerate(probabilities.cpu().numpy()):
-                cat_info = class_mappings["index_to_category"].get(str(idx), {})
-                all_predictions.append({
-                    "category": cat_info.get("category", f"CLASS_{idx}"),
-                    "confidence": float(prob) * 100
-                })
-            all_predictions.sort(key=lambda x: x["confidence"], reverse=True)
-        
-        return {
-            "success": True,
-            "class_index": class_index,
-            "category": category,
-            "category_name": original_name,
-            "description": CATEGORY_DESCRIPTIONS.get(category, "Civic issue detected"),
-            "confidence": round(confidence, 2),
-            "department": department,
-            "priority": priority,
-            "legacy_category": LEGACY_CATEGORY_MAP.get(category, "other"),
-            "all_predictions": all_predictions[:5]  # Top 5 predictions
-        }
+        # Decoding and inference run off the event loop, batched together
+        # with other in-flight requests; repeat uploads hit the cache
+        start = time.perf_counter()
+        try:
+            contents, sha = await read_upload(file)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        timings = {"read": time.perf_counter() - start}
+        try:
+            result = await classify_bytes(contents, timings, options, sha)
+        except QueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        record_timings(timings)
+        if TIMING_HEADER:
+            timings["total"] = time.perf_counter() - start
+            response.headers["X-Timing"] = format_timing_header(timings)
+        return result
         
     except HTTPException:
         raise
@@ -234,6 +859,292 @@ async def predict(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
 
+def parse_sources(sources):
+    """Parse the `sources` form field: a JSON list or one path/URL per line"""
+    if not sources:
+        return []
+    text = sources.strip()
+    if text.startswith("["):
+        try:
+            items = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid sources JSON: {e}")
+        return [str(item).strip() for item in items if str(item).strip()]
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+async def fetch_url(source):
+    """
+    Download an allowed http(s) URL without blocking a worker thread.
+    
+    Redirects are not followed, so an allowed prefix cannot bounce the fetch
+    elsewhere. The download stops at the upload limit.
+    """
+    if not any(source.startswith(prefix) for prefix in BATCH_URL_PREFIXES):
+        raise ValueError("URL is not allowed (see ML_BATCH_URL_PREFIXES)")
+    async with url_client.stream("GET", source) as response:
+        response.raise_for_status()
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES:
+            raise UploadRejected(413, f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit")
+        contents = bytearray()
+        async for chunk in response.aiter_bytes():
+            contents += chunk
+            if len(contents) > MAX_UPLOAD_BYTES:
+                raise UploadRejected(413, f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit")
+    return bytes(contents)
+
+
+def read_local_source(source):
+    """Read a path below ML_BATCH_LOCAL_ROOT, stopping just past the upload limit"""
+    if not BATCH_LOCAL_ROOT:
+        raise ValueError("Local paths are disabled (set ML_BATCH_LOCAL_ROOT)")
+    root = os.path.realpath(BATCH_LOCAL_ROOT)
+    path = os.path.realpath(os.path.join(root, source))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError("Path is outside ML_BATCH_LOCAL_ROOT")
+    with open(path, "rb") as f:
+        return f.read(MAX_UPLOAD_BYTES + 1)
+
+
+async def read_source(source):
+    """
+    Read and validate image bytes from an allowed http(s) URL or local path.
+    
+    Returns (contents, sha256). Fetches and file reads stay off the inference
+    pool, so slow sources cannot hold up forward passes for other clients.
+    """
+    if source.startswith(("http://", "https://")):
+        contents = await fetch_url(source)
+    else:
+        contents = await asyncio.to_thread(read_local_source, source)
+    sha, _ = await asyncio.to_thread(inspect_upload, io.BytesIO(contents), MAX_UPLOAD_BYTES, MAX_IMAGE_PIXELS)
+    return contents, sha
+
+
+async def classify_item(index, name, load, options=None):
+    """Classify one batch item, reporting failures in the result instead of raising"""
+    try:
+        start = time.perf_counter()
+        contents, sha = await load()
+        timings = {"read": time.perf_counter() - start}
+        result = await classify_bytes(contents, timings, options, sha)
+        record_timings(timings)
+    except Exception as e:
+        result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+    return {"index": index, "source": name, **result}
+
+
+@app.post("/predict/batch")
+async def predict_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    sources: Optional[str] = Form(None),
+    top_k: int = DEFAULT_TOP_K,
+    min_confidence: Optional[float] = None,
+    compact: bool = False
+):
+    """
+    Classify many images in one request
+
+    Accepts any number of uploaded `files` and/or a `sources` field holding
+    http(s) URLs allowed by ML_BATCH_URL_PREFIXES or paths below
+    ML_BATCH_LOCAL_ROOT (JSON list or one per line).
+    Images are classified through the shared micro-batching queue and streamed
+    back as NDJSON, one line per image in completion order. Each line carries
+    the item's `index` and `source`; a failed item has success=false and an
+    `error` message instead of failing the whole batch. `top_k`,
+    `min_confidence` and `compact` shape each line as for /predict.
+    """
+    require_model()
+    options = response_options(top_k, min_confidence, compact)
+    
+    items = []
+    for upload in files or []:
+        items.append((upload.filename or "upload", lambda upload=upload: read_upload(upload)))
+    for source in parse_sources(sources):
+        items.append((source, lambda source=source: read_source(source)))
+    
+    if not items:
+        raise HTTPException(status_code=400, detail="No files or sources provided")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many items ({len(items)}), limit is {BATCH_MAX_ITEMS}"
+        )
+    
+    async def stream_results():
+        # Keep a bounded window in flight so large batches cannot flood the
+        # shared queue, while still filling whole model-sized batches
+        window = max(MAX_BATCH_SIZE * INFERENCE_WORKERS, 1)
+        pending = set()
+        next_item = 0
+        while next_item < len(items) or pending:
+            while next_item < len(items) and len(pending) < window:
+                name, load = items[next_item]
+                pending.add(asyncio.ensure_future(classify_item(next_item, name, load, options)))
+                next_item += 1
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield json.dumps(task.result()) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+async def require_embeddings():
+    """Make sure the active model can embed, loading eager weights on first use"""
+    require_model()
+    try:
+        await run_in_executor(get_embedder, model_slots.active)
+    except FileNotFoundError:
+        raise HTTPException(status_code=503, detail="Embeddings not available. Eager model weights are required.")
+
+
+@app.post("/embed")
+async def embed(
+    file: UploadFile = File(...),
+    id: Optional[str] = Form(None),
+    district: Optional[str] = Form(None)
+):
+    """
+    Return the 512-d unit-normalized image embedding (penultimate ResNet features)
+    
+    If `id` is given the embedding is also stored in the similarity index
+    under that id (replacing any previous entry), tagged with `district`.
+    """
+    await require_embeddings()
+    try:
+        embedding, slot = await embed_bytes((await read_upload(file))[0])
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Embedding error: {str(e)}")
+    if id is not None:
+        await run_in_executor(vector_index.add, id, embedding, district, slot.embedder_id)
+    return {
+        "success": True,
+        "dim": len(embedding),
+        "embedding": [round(float(value), 6) for value in embedding],
+        "indexed": id is not None,
+        "model_version": slot.version
+    }
+
+
+@app.post("/similar")
+async def similar(
+    file: Optional[UploadFile] = File(None),
+    id: Optional[str] = Form(None),
+    district: Optional[str] = Form(None),
+    k: int = Form(5),
+    min_similarity: Optional[float] = Form(None),
+    add: bool = Form(False)
+):
+    """
+    Find previously indexed reports that look like this image
+    
+    Query with an uploaded `file`, or with the `id` of an indexed report.
+    Results (best first, cosine similarity in [-1, 1]) are limited to
+    `district` when given. With `add=true` and an `id`, the uploaded image is
+    indexed after the search, so duplicates can be flagged at upload time in
+    a single call.
+    """
+    await require_embeddings()
+    if not 1 <= k <= SIMILAR_MAX_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {SIMILAR_MAX_K}")
+    if file is not None:
+        try:
+            embedding, slot = await embed_bytes((await read_upload(file))[0])
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        except QueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Embedding error: {str(e)}")
+    elif id is not None:
+        embedding, slot = await asyncio.to_thread(vector_index.get, id), model_slots.active
+        if embedding is None:
+            raise HTTPException(status_code=404, detail=f"No indexed report with id '{id}'")
+    else:
+        raise HTTPException(status_code=400, detail="Provide a file or the id of an indexed report")
+    
+    matches = await run_in_executor(
+        lambda: vector_index.search(embedding, k, district=district, exclude_id=id, min_similarity=min_similarity)
+    )
+    indexed = False
+    if add and file is not None and id is not None:
+        await run_in_executor(vector_index.add, id, embedding, district, slot.embedder_id)
+        indexed = True
+    return {"success": True, "matches": matches, "indexed": indexed, "model_version": slot.version}
+
+
+@app.delete("/similar/{item_id}")
+async def remove_similar(item_id: str):
+    """Remove a report from the similarity index"""
+    if vector_index is None or not await run_in_executor(vector_index.remove, item_id):
+        raise HTTPException(status_code=404, detail=f"No indexed report with id '{item_id}'")
+    return {"status": "removed", "id": item_id}
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    top_k: int = DEFAULT_TOP_K,
+    min_confidence: Optional[float] = None,
+    compact: bool = False
+):
+    """
+    Queue an image for classification and return a job id at once
+    
+    The image is stored on disk, so bursts are absorbed instead of timing
+    out, and jobs survive a restart. Poll GET /jobs/{job_id} (optionally
+    long-polling with `wait`) for the result, which has the same shape as
+    a /predict response. Accepted while the model is still loading.
+    """
+    if model is None and model_slots.loading is None:
+        raise HTTPException(status_code=503, detail="Model not loaded. Please train the model first.")
+    options = response_options(top_k, min_confidence, compact)
+    try:
+        contents, sha = await read_upload(file)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    if await asyncio.to_thread(job_store.pending) >= JOB_MAX_PENDING:
+        raise HTTPException(status_code=503, detail=f"Job queue is full ({JOB_MAX_PENDING} pending jobs)",
+                            headers={"Retry-After": "5"})
+    job_id = await asyncio.to_thread(job_store.submit, contents, sha, options)
+    job_submitted.set()
+    return {"success": True, "job_id": job_id, "status": QUEUED, "status_url": f"/jobs/{job_id}"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """
+    Status of a classification job: queued, running, done (with `result`) or failed (with `error`)
+    
+    With `wait` (seconds, up to ML_JOB_MAX_WAIT) the call long-polls: it
+    returns as soon as the job finishes, or with the current status once
+    `wait` has passed.
+    """
+    if not 0 <= wait <= JOB_MAX_WAIT:
+        raise HTTPException(status_code=400, detail=f"wait must be between 0 and {JOB_MAX_WAIT:g} seconds")
+    deadline = time.monotonic() + wait
+    while True:
+        finished = job_finished
+        job = await asyncio.to_thread(job_store.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"No job with id '{job_id}'")
+        remaining = deadline - time.monotonic()
+        if job["status"] in FINISHED or remaining <= 0:
+            break
+        try:
+            await asyncio.wait_for(finished.wait(), min(JOB_POLL_INTERVAL, remaining))
+        except asyncio.TimeoutError:
+            pass
+    if job["status"] == QUEUED:
+        job["queue_position"] = await asyncio.to_thread(job_store.position, job["created_at"])
+    return job
+
+
 @app.get("/categories")
 async def get_categories():
     """Get all available categories with their info"""
@@ -254,17 +1165,92 @@ async def get_categories():
     return {"categories": [], "message": "No mappings loaded"}
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Prediction cache hit/miss counters"""
+    return prediction_cache.stats()
+
+
+@app.delete("/cache")
+async def clear_cache():
+    """Invalidate all cached predictions"""
+    prediction_cache.clear()
+    return {"status": "cleared", **prediction_cache.stats()}
+
+
+async def reload_in_background(backend):
+    """Prepare a new model version off the event loop, then swap it in"""
+    try:
+        slot = await run_in_executor(prepare_model_slot, backend)
+        activate_model_slot(slot)
+        return slot
+    except Exception as e:
+        model_slots.last_error = f"{type(e).__name__}: {e}"
+        print(f"❌ Model reload failed, keeping {model_version()}: {e}")
+        raise
+    finally:
+        model_slots.loading = None
+
+
+def model_version():
+    return model_slots.active.version if model_slots.active else None
+
+
+@app.get("/model")
+async def model_status():
+    """Active, previous and loading model versions"""
+    return model_slots.status()
+
+
 @app.post("/reload")
-async def reload_model():
-    """Reload the model and mappings (useful after retraining)"""
-    load_model_and_mappings()
+async def reload_model(backend: Optional[str] = None, wait: bool = False):
+    """
+    Load a new model version (useful after retraining) without downtime
+    
+    The new model is loaded, warmed up and canary-checked in the background
+    while the current version keeps serving; it is then swapped in atomically.
+    Pass `wait=true` to block until the swap finishes, and `backend` to switch
+    inference backends.
+    
+    Under `run_server.py --production` this reloads only the worker that
+    handled the request (see `worker_id`); send SIGHUP to the parent process
+    to reload every worker.
+    """
+    global reload_task
+    if model_slots.loading is not None:
+        raise HTTPException(status_code=409, detail=f"Reload already in progress ({model_slots.loading})")
+    backend = (backend or (model_slots.active.backend if model_slots.active else MODEL_BACKEND)).lower()
+    model_slots.loading = backend
+    reload_task = asyncio.create_task(reload_in_background(backend))
+    # Failures are recorded in model_slots.last_error; mark them retrieved
+    reload_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    if not wait:
+        return {"status": "loading", "backend": backend, "active_version": model_version(), "worker_id": WORKER_ID}
+    try:
+        slot = await reload_task
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Reload failed: {e}")
     return {
         "status": "reloaded",
+        "worker_id": WORKER_ID,
         "model_loaded": model is not None,
-        "mappings_loaded": class_mappings is not None
+        "mappings_loaded": class_mappings is not None,
+        "model": slot.info()
     }
 
 
+@app.post("/rollback")
+async def rollback_model():
+    """Swap back to the previously active model version (per worker under run_server.py --production)"""
+    try:
+        slot = model_slots.rollback()
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    use_model_slot(slot)
+    print(f"↩️ Rolled back to model {slot.version}")
+    return {"status": "rolled_back", "worker_id": WORKER_ID, **model_slots.status()}
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
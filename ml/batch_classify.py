@@ -0,0 +1,311 @@
+"""
+Offline Batch Classification
+Classifies a directory, glob or manifest of stored images with the same model
+as api.py and writes the results to CSV, JSONL or Parquet
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from classifier import BACKENDS, backend_device, load_classifier
+from manifest import IMAGE_EXTENSIONS
+from model_registry import CategoryTable
+from preprocessing import Preprocessor
+
+FORMATS = ("csv", "jsonl", "parquet")
+COLUMNS = (
+    "path", "class_index", "category", "category_name", "confidence",
+    "department", "priority", "top_predictions", "error",
+)
+
+# Per-process preprocessor for the decode pool
+_preprocessor = None
+
+
+def init_decoder(use_draft):
+    global _preprocessor
+    torch.set_num_threads(1)
+    _preprocessor = Preprocessor(use_draft=use_draft)
+
+
+def decode_chunk(paths):
+    """
+    Worker: decode and resize a chunk of files to HWC uint8 arrays, or report why not.
+
+    Returns (path, array, error, seconds) tuples, where seconds covers reading and decoding.
+    """
+    results = []
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            with open(path, "rb") as f:
+                image, _ = _preprocessor.decode(f.read())
+            array, error = np.asarray(_preprocessor.resize(image)), None
+        except Exception as e:
+            array, error = None, f"{type(e).__name__}: {e}"
+        results.append((path, array, error, time.perf_counter() - start))
+    return results
+
+
+def iter_inputs(inputs):
+    """
+    Yield image paths from directories (walked recursively), glob patterns,
+    manifest.json files from manifest.py, or text files listing one path per line.
+    """
+    for item in inputs:
+        if os.path.isdir(item):
+            for dirpath, dirnames, filenames in os.walk(item):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(dirpath, name)
+        elif os.path.isfile(item) and item.endswith(".json"):
+            with open(item, "r") as f:
+                manifest = json.load(f)
+            for path in manifest["paths"]:
+                yield os.path.join(manifest["root"], path)
+        elif os.path.isfile(item) and not item.lower().endswith(IMAGE_EXTENSIONS):
+            with open(item, "r") as f:
+                for line in f:
+                    if line.strip():
+                        yield line.strip()
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                print(f"⚠️ No images match {item}", file=sys.stderr)
+            yield from matches
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ResultWriter:
+    """
+    Appends result rows to CSV, JSONL or Parquet.
+
+    CSV and JSONL are appended to in place and flushed after every batch.
+    Parquet files cannot be appended to, so rows from an earlier run are
+    copied into a new file that replaces the old one when the run ends.
+    """
+
+    def __init__(self, path, fmt, resume):
+        self.path = path
+        self.fmt = fmt
+        self.done = set()
+        exists = resume and os.path.exists(path)
+        if exists:
+            self.done = self._read_done()
+        if fmt == "csv":
+            self._file = open(path, "a" if exists else "w", newline="")
+            self._csv = csv.DictWriter(self._file, fieldnames=COLUMNS)
+            if not exists:
+                self._csv.writeheader()
+        elif fmt == "jsonl":
+            self._file = open(path, "a" if exists else "w")
+        else:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("Parquet output requires: pip install pyarrow")
+            self._pa = pa
+            self._schema = pa.schema([
+                ("path", pa.string()), ("class_index", pa.int32()), ("category", pa.string()),
+                ("category_name", pa.string()), ("confidence", pa.float32()), ("department", pa.string()),
+                ("priority", pa.string()), ("top_predictions", pa.string()), ("error", pa.string()),
+            ])
+            self._tmp_path = f"{path}.tmp"
+            self._parquet = pq.ParquetWriter(self._tmp_path, self._schema)
+            if exists:
+                self._parquet.write_table(pq.read_table(path, schema=self._schema))
+
+    def _read_done(self):
+        """Paths that already have a successful row; failed ones are retried and get a new row"""
+        if self.fmt == "csv":
+            with open(self.path, "r", newline="") as f:
+                return {row["path"] for row in csv.DictReader(f) if not row.get("error")}
+        if self.fmt == "jsonl":
+            done = set()
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn last line from an interrupted run
+                    if "path" in row and not row.get("error"):
+                        done.add(row["path"])
+            return done
+        import pyarrow.parquet as pq
+        table = pq.read_table(self.path, columns=["path", "error"])
+        return {
+            path for path, error in zip(table.column("path").to_pylist(), table.column("error").to_pylist())
+            if not error
+        }
+
+    def write(self, rows):
+        if self.fmt == "csv":
+            self._csv.writerows(rows)
+            self._file.flush()
+        elif self.fmt == "jsonl":
+            self._file.write("".join(json.dumps(row) + "\n" for row in rows))
+            self._file.flush()
+        else:
+            columns = {name: [row.get(name) for row in rows] for name in COLUMNS}
+            self._parquet.write_table(self._pa.table(columns, schema=self._schema))
+
+    def close(self):
+        if self.fmt == "parquet":
+            self._parquet.close()
+            os.replace(self._tmp_path, self.path)
+        else:
+            self._file.close()
+
+
+def result_rows(paths, probabilities, table, top_k):
+    """Result rows for one forward pass, using one batched topk"""
+    values, indices = torch.topk(probabilities, k=min(top_k, probabilities.shape[1]), dim=1)
+    rows = []
+    for path, row_values, row_indices in zip(paths, values.tolist(), indices.tolist()):
+        meta = table.metadata[row_indices[0]]
+        rows.append({
+            "path": path,
+            "class_index": row_indices[0],
+            "category": meta["category"],
+            "category_name": meta["category_name"],
+            "confidence": round(row_values[0] * 100, 2),
+            "department": meta["department"],
+            "priority": meta["priority"],
+            "top_predictions": ";".join(
+                f"{table.labels[idx]}:{value * 100:.2f}" for value, idx in zip(row_values, row_indices)
+            ),
+            "error": None,
+        })
+    return rows
+
+
+def error_row(path, error):
+    return {**{name: None for name in COLUMNS}, "path": path, "error": error}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Classify stored images offline")
+    parser.add_argument("inputs", nargs="+",
+                        help="Directories, glob patterns ('photos/**/*.jpg'), manifest.json or path-list files")
+    parser.add_argument("--output", "-o", required=True, help="Results file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--format", choices=FORMATS, help="Output format (default: from --output extension)")
+    parser.add_argument("--backend", choices=BACKENDS, default=os.getenv("ML_MODEL_BACKEND", "eager"))
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Decode processes (default: cores - 1)")
+    parser.add_argument("--threads", type=int, default=None, help="Torch intra-op threads for the forward pass")
+    parser.add_argument("--top-k", type=int, default=3, help="Ranked predictions kept per image")
+    parser.add_argument("--resume", action="store_true", help="Skip images already in --output and append")
+    parser.add_argument("--no-draft", action="store_true", help="Fully decode JPEGs instead of draft mode")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+    if args.format is None:
+        extension = os.path.splitext(args.output)[1].lstrip(".").lower()
+        if extension not in FORMATS:
+            parser.error("Cannot infer the format from --output, pass --format")
+        args.format = extension
+    return args
+
+
+def main():
+    args = parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    with open("model/class_mappings.json", "r") as f:
+        mappings = json.load(f)
+    num_classes = mappings.get("num_classes", 9)
+    model, model_path = load_classifier(args.backend, num_classes, device, num_threads=args.threads)
+    device = backend_device(args.backend, device)
+    table = CategoryTable(mappings, num_classes, {}, {})
+    preprocessor = Preprocessor()
+    print(f"📦 Loaded {args.backend} model from {model_path} on {device}", file=sys.stderr)
+
+    writer = ResultWriter(args.output, args.format, args.resume)
+    if writer.done:
+        print(f"♻️ Resuming: {len(writer.done)} images already in {args.output}", file=sys.stderr)
+    paths = (path for path in iter_inputs(args.inputs) if path not in writer.done)
+
+    processed = failed = 0
+    start = last_report = time.perf_counter()
+    # Decode a few chunks ahead of the forward pass, in input order
+    chunk_size = max(1, args.batch_size // 4)
+    max_pending = 4 * args.workers
+    try:
+        with ProcessPoolExecutor(args.workers, initializer=init_decoder, initargs=(not args.no_draft,)) as pool:
+            pending = deque()
+            chunks = chunked(paths, chunk_size)
+            batch_paths, batch_images = [], []
+
+            def flush_batch():
+                nonlocal processed
+                if not batch_paths:
+                    return
+                with torch.no_grad():
+                    outputs = model(preprocessor.to_batch(batch_images).to(device))
+                    probabilities = torch.softmax(outputs.float(), dim=1).cpu()
+                writer.write(result_rows(batch_paths, probabilities, table, args.top_k))
+                processed += len(batch_paths)
+                batch_paths.clear()
+                batch_images.clear()
+
+            while True:
+                while len(pending) < max_pending:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    pending.append(pool.submit(decode_chunk, chunk))
+                if not pending:
+                    break
+                errors = []
+                for path, image, error, _ in pending.popleft().result():
+                    if error is not None:
+                        errors.append(error_row(path, error))
+                    else:
+                        batch_paths.append(path)
+                        batch_images.append(image)
+                        if len(batch_paths) >= args.batch_size:
+                            flush_batch()
+                if errors:
+                    writer.write(errors)
+                    failed += len(errors)
+
+                now = time.perf_counter()
+                if now - last_report >= args.progress_interval:
+                    print(f"  {processed} images ({processed / (now - start):.1f} img/s), {failed} failed",
+                          file=sys.stderr)
+                    last_report = now
+            flush_batch()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Classified {processed} images in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.1f} img/s), "
+          f"{failed} failed -> {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Dynamic Micro-Batching for the Classifier API
+Coalesces concurrent /predict requests into a single stacked forward pass
+"""
+
+import asyncio
+import time
+
+import torch
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue cannot accept another request"""
+
+
+class MicroBatcher:
+    """
+    Request-coalescing inference queue.
+
+    Callers submit a single preprocessed image tensor (C, H, W) and await their
+    own row of the batched output. A background task collects pending requests
+    until either `max_batch_size` items are waiting or `max_wait_ms` has passed
+    since the first one arrived, then runs `infer_fn` once on the stacked batch.
+
+    When an `executor` is given, stacking and `infer_fn` run there instead of
+    on the event loop, with up to `max_concurrent_batches` batches in flight.
+    `on_batch(batch_size, forward_seconds)` is called after every forward pass.
+    """
+
+    def __init__(self, infer_fn, max_batch_size=16, max_wait_ms=5.0, max_queue_size=256,
+                 executor=None, max_concurrent_batches=1, on_batch=None):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue_size = max(1, int(max_queue_size))
+        self.executor = executor
+        self.max_concurrent_batches = max(1, int(max_concurrent_batches))
+        self.on_batch = on_batch
+        self._queue = None
+        self._task = None
+        self._slots = None
+        self._inflight = set()
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        """Start the background batching task on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching task and fail any requests still waiting"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future, _, _ = self._queue.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError("Inference queue stopped"))
+
+    async def submit(self, tensor, timings=None):
+        """
+        Queue one image tensor and wait for its output row.
+
+        If a `timings` dict is given, the seconds spent waiting in the queue and
+        in the batch's forward pass are stored under "queue" and "forward".
+        """
+        if not self.running:
+            raise RuntimeError("Inference queue is not running")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((tensor, future, timings, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise QueueFullError(
+                f"Inference queue is full ({self.max_queue_size} pending requests)"
+            )
+        return await future
+
+    async def _collect(self):
+        """Wait for the first request, then gather more until full or timed out"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Drain anything that is already waiting without extending the deadline
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    def _forward(self, tensors):
+        return self.infer_fn(torch.stack(tensors))
+
+    async def _dispatch(self, batch):
+        start = time.perf_counter()
+        try:
+            tensors = [item[0] for item in batch]
+            if self.executor is not None:
+                loop = asyncio.get_running_loop()
+                outputs = await loop.run_in_executor(self.executor, self._forward, tensors)
+            else:
+                outputs = self._forward(tensors)
+        except Exception as e:
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        forward_seconds = time.perf_counter() - start
+        if self.on_batch is not None:
+            self.on_batch(len(batch), forward_seconds)
+        for row, (_, future, timings, enqueued_at) in zip(outputs, batch):
+            if timings is not None:
+                timings["queue"] = start - enqueued_at
+                timings["forward"] = forward_seconds
+            if not future.done():
+                future.set_result(row)
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            batch = await self._collect()
+            # Drop requests whose callers have gone away (e.g. client disconnected)
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
@@ -0,0 +1,364 @@
+"""
+Urban Issues Classifier Benchmark
+Drives the /predict endpoint of api.py with synthetic JPEGs and reports
+throughput, latency percentiles and peak RSS as JSON
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+from PIL import Image
+
+# Typical upload resolutions: small web image, 1080p screenshot, 12MP phone photo
+IMAGE_SIZES = {
+    "small": (640, 480),
+    "hd": (1920, 1080),
+    "12mp": (4000, 3000),
+}
+
+
+def make_jpeg(width, height, seed=0, quality=90):
+    """Synthetic photo-like JPEG: smooth gradients plus sensor-style noise"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        127 + 100 * np.sin(x / (width / 3.0) + rng.uniform(0, 6)),
+        127 + 100 * np.cos(y / (height / 2.5) + rng.uniform(0, 6)),
+        127 + 100 * np.sin((x + y) / (width / 2.0) + rng.uniform(0, 6)),
+    ], axis=-1)
+    base += rng.normal(0, 12, base.shape)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(base, 0, 255).astype(np.uint8)).save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def read_peak_rss_mb(pid=None):
+    """Peak resident set size (VmHWM) of a process in MB, or None where it cannot be read"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    if pid is None:
+        try:
+            import resource
+        except ImportError:
+            return None  # Windows: no getrusage, peak RSS is not reported
+        # ru_maxrss is KB on Linux, bytes on macOS
+        scale = 1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    return None
+
+
+def reset_peak_rss(pid=None):
+    """Reset VmHWM so each run reports its own peak (Linux only, best effort)"""
+    try:
+        with open(f"/proc/{pid or 'self'}/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+async def drive(client, payloads, concurrency, num_requests):
+    """Send `num_requests` /predict calls from `concurrency` workers, return per-request results"""
+    latencies, statuses = [], {}
+    counter = iter(range(num_requests))
+
+    async def worker():
+        for i in counter:
+            payload = payloads[i % len(payloads)]
+            start = time.perf_counter()
+            try:
+                response = await client.post("/predict", files={"file": ("bench.jpg", payload, "image/jpeg")})
+                status = response.status_code
+            except httpx.HTTPError:
+                status = "error"
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+def summarize(latencies, statuses, elapsed):
+    ms = [1000.0 * value for value in latencies]
+    return {
+        "requests": len(latencies),
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": float(np.mean(ms)) if ms else 0.0,
+            "p50": percentile(ms, 50),
+            "p95": percentile(ms, 95),
+            "p99": percentile(ms, 99),
+            "max": max(ms) if ms else 0.0,
+        },
+    }
+
+
+async def run_inprocess(backend, sweep, args):
+    """
+    Benchmark the FastAPI app in this process through an ASGI transport.
+
+    The model is loaded before the lifespan yields (ML_LAZY_LOAD=false), so
+    every measured request hits a warm model; startup time is measured
+    separately by --cold-start.
+    """
+    os.environ["ML_MODEL_BACKEND"] = backend
+    os.environ["ML_CACHE_MAX_ENTRIES"] = "0"
+    os.environ["ML_LAZY_LOAD"] = "false"
+    import api
+
+    api.MODEL_BACKEND = backend
+    api.LAZY_LOAD = False
+    api.prediction_cache.max_entries = 0
+    results = []
+    async with api.app.router.lifespan_context(api.app):
+        slot = api.model_slots.active
+        if slot is None or slot.backend != backend:
+            raise RuntimeError(f"Model failed to load for backend '{backend}': {api.model_slots.last_error}")
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            for size_name, payloads, concurrency in sweep:
+                await drive(client, payloads, concurrency, args.warmup)
+                reset_peak_rss()
+                latencies, statuses, elapsed = await drive(client, payloads, concurrency, args.requests)
+                results.append({
+                    "mode": "inprocess", "backend": backend, "image_size": size_name,
+                    "concurrency": concurrency, **summarize(latencies, statuses, elapsed),
+                    "peak_rss_mb": read_peak_rss_mb(),
+                })
+                print_result(results[-1])
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(base_url, process, timeout):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                response = await client.get("/health")
+                if response.json().get("model_loaded"):
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"Server at {base_url} not ready after {timeout}s")
+
+
+def start_server(backend, port, args):
+    """Start `uvicorn api:app` for `backend` as a subprocess"""
+    ml_dir = os.path.dirname(os.path.abspath(__file__))
+    env = {
+        **os.environ,
+        "ML_MODEL_BACKEND": backend,
+        "ML_CACHE_MAX_ENTRIES": "0",
+        "PYTHONPATH": os.pathsep.join(filter(None, [ml_dir, os.environ.get("PYTHONPATH")])),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=args.server_cwd or os.getcwd(),
+        env=env,
+    )
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def run_cold_start(backend, args):
+    """
+    Time a fresh server from spawn to liveness and to readiness, `args.cold_start` times.
+
+    Each run starts a new interpreter, so imports, weight loading and warm-up
+    are all included (the OS page cache stays warm between runs). The server
+    keeps its default lazy load, so liveness answers before the model is
+    loaded and readiness marks the end of warm-up.
+    """
+    live, ready, startup = [], [], None
+    for _ in range(args.cold_start):
+        port = free_port()
+        start = time.perf_counter()
+        process = start_server(backend, port, args)
+        live_s = None
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=2.0) as client:
+                while time.perf_counter() - start < args.startup_timeout:
+                    if process.poll() is not None:
+                        raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+                    try:
+                        if live_s is None and (await client.get("/health/live")).status_code == 200:
+                            live_s = time.perf_counter() - start
+                        if live_s is not None:
+                            response = await client.get("/health/ready")
+                            if response.status_code == 200:
+                                ready.append(time.perf_counter() - start)
+                                live.append(live_s)
+                                startup = response.json().get("startup")
+                                break
+                            if response.json().get("status") == "failed":
+                                raise RuntimeError(f"Model failed to load: {response.json().get('error')}")
+                    except httpx.HTTPError:
+                        pass
+                    await asyncio.sleep(0.05)
+                else:
+                    raise TimeoutError(f"Server not ready after {args.startup_timeout}s")
+        finally:
+            stop_server(process)
+
+    budget = float(os.environ.get("ML_COLD_START_BUDGET_SECONDS", "15"))
+    result = {
+        "mode": "cold_start", "backend": backend, "runs": len(ready),
+        "live_s": {"p50": percentile(live, 50), "max": max(live)},
+        "ready_s": {"p50": percentile(ready, 50), "max": max(ready)},
+        "server_startup_s": startup,
+        "budget_s": budget,
+        "within_budget": max(ready) <= budget,
+    }
+    print(
+        f"  cold start {backend:11s} live p50 {result['live_s']['p50']:.2f}s | "
+        f"ready p50 {result['ready_s']['p50']:.2f}s max {result['ready_s']['max']:.2f}s | "
+        f"budget {budget:.0f}s {'✅' if result['within_budget'] else '⚠️'}",
+        file=sys.stderr,
+    )
+    return result
+
+
+async def run_uvicorn(backend, sweep, args):
+    """Benchmark a real uvicorn server started as a subprocess"""
+    port = free_port()
+    process = start_server(backend, port, args)
+    base_url = f"http://127.0.0.1:{port}"
+    results = []
+    try:
+        await wait_until_ready(base_url, process, args.startup_timeout)
+        limits = httpx.Limits(max_connections=max(c for _, _, c in sweep))
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            for size_name, payloads, concurrency in sweep:
+                await drive(client, payloads, concurrency, args.warmup)
+                reset_peak_rss(process.pid)
+                latencies, statuses, elapsed = await drive(client, payloads, concurrency, args.requests)
+                results.append({
+                    "mode": "uvicorn", "backend": backend, "image_size": size_name,
+                    "concurrency": concurrency, **summarize(latencies, statuses, elapsed),
+                    "peak_rss_mb": read_peak_rss_mb(process.pid),
+                })
+                print_result(results[-1])
+    finally:
+        stop_server(process)
+    return results
+
+
+def print_result(result):
+    latency = result["latency_ms"]
+    print(
+        f"  {result['mode']:9s} {result['backend']:11s} {result['image_size']:5s} "
+        f"c={result['concurrency']:<3d} {result['throughput_rps']:7.1f} req/s | "
+        f"p50 {latency['p50']:7.1f} ms | p95 {latency['p95']:7.1f} ms | p99 {latency['p99']:7.1f} ms | "
+        f"RSS {result['peak_rss_mb'] or 0:.0f} MB",
+        file=sys.stderr,
+    )
+
+
+def environment_info():
+    import torch
+    return {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "env": {k: v for k, v in os.environ.items() if k.startswith("ML_")},
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the classifier API")
+    parser.add_argument("--modes", nargs="+", choices=("inprocess", "uvicorn"), default=["inprocess"],
+                        help="inprocess drives the app through ASGI with the model loaded up front; "
+                             "uvicorn starts a server and waits for it to be ready")
+    parser.add_argument("--backends", nargs="+", default=["eager"],
+                        help="Inference backends to compare (eager, torchscript, onnxruntime, quantized, student)")
+    parser.add_argument("--sizes", nargs="+", choices=tuple(IMAGE_SIZES), default=["small", "12mp"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per configuration")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per configuration")
+    parser.add_argument("--images", type=int, default=4, help="Distinct synthetic images per size")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--cold-start", type=int, default=0,
+                        help="Also time this many fresh server starts to liveness and readiness")
+    parser.add_argument("--server-cwd", help="Working directory for uvicorn, where model/ lives (default: cwd)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    payloads = {
+        name: [make_jpeg(*IMAGE_SIZES[name], seed=i) for i in range(args.images)]
+        for name in args.sizes
+    }
+    sweep = [(name, payloads[name], c) for name in args.sizes for c in args.concurrency]
+
+    results = []
+    for backend in args.backends:
+        if args.cold_start:
+            results.append(await run_cold_start(backend, args))
+        if "uvicorn" in args.modes:
+            results.extend(await run_uvicorn(backend, sweep, args))
+        if "inprocess" in args.modes:
+            # The app is imported once; later backends reuse it with a fresh lifespan
+            results.extend(await run_inprocess(backend, sweep, args))
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment_info(),
+        "config": {
+            "requests": args.requests, "warmup": args.warmup, "images": args.images,
+            "sizes": {name: IMAGE_SIZES[name] for name in args.sizes},
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+        print(f"✅ Benchmark report saved to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""
+Confidence-Gated Cascade Inference
+A cheap first-stage model answers the images it is confident about; the rest are
+escalated to the full model, optionally with batched test-time augmentation
+"""
+
+import time
+
+import torch
+import torch.nn.functional as F
+
+from classifier import IMG_SIZE
+
+TTA_MODES = ("none", "flip", "multicrop")
+# Side of the multicrop crops relative to the image
+CROP_SCALE = 0.875
+
+
+def resize_batch(batch, size):
+    """Bilinearly resize a normalized NCHW batch to size x size (no-op if it already is)"""
+    if batch.shape[-2:] == (size, size):
+        return batch
+    return F.interpolate(batch, size=(size, size), mode="bilinear", align_corners=False, antialias=True)
+
+
+def tta_views(batch, mode):
+    """
+    Augmented copies of `batch` for test-time augmentation.
+
+    flip adds the horizontal mirror; multicrop adds the mirror plus the center
+    and four corner crops, each resized back to the input size.
+    """
+    if mode not in TTA_MODES:
+        raise ValueError(f"Unknown TTA mode '{mode}', expected one of {TTA_MODES}")
+    views = [batch]
+    if mode == "none":
+        return views
+    views.append(batch.flip(-1))
+    if mode == "multicrop":
+        height, width = batch.shape[-2:]
+        crop_h, crop_w = int(height * CROP_SCALE), int(width * CROP_SCALE)
+        offsets = [((height - crop_h) // 2, (width - crop_w) // 2),
+                   (0, 0), (0, width - crop_w), (height - crop_h, 0), (height - crop_h, width - crop_w)]
+        for top, left in offsets:
+            crop = batch[..., top:top + crop_h, left:left + crop_w]
+            views.append(F.interpolate(crop, size=(height, width), mode="bilinear", align_corners=False))
+    return views
+
+
+def predict(model, batch, device, tta="none"):
+    """Softmax probabilities (on CPU) for `batch`, averaged over all TTA views in a single forward pass"""
+    views = tta_views(batch, tta)
+    outputs = model(torch.cat(views).to(device))
+    probabilities = torch.softmax(outputs.float(), dim=1).cpu()
+    return probabilities.view(len(views), len(batch), -1).mean(dim=0)
+
+
+def cascade_predict(slot, batch, threshold, fast_size=IMG_SIZE, tta="none"):
+    """
+    Probabilities for `batch` from the cheapest stage that is confident enough.
+
+    Without a fast model on the slot every image goes to the full model.
+    Returns (probabilities, escalated) where `escalated` marks the images the
+    full model answered.
+    """
+    if slot.fast_model is None:
+        return predict(slot.model, batch, slot.device, tta), torch.ones(len(batch), dtype=torch.bool)
+    probabilities = predict(slot.fast_model, resize_batch(batch, fast_size), slot.fast_device)
+    escalated = probabilities.max(dim=1).values < threshold
+    if escalated.any():
+        probabilities[escalated] = predict(slot.model, batch[escalated], slot.device, tta)
+    return probabilities, escalated
+
+
+def warm_up_cascade(slot, fast_size=IMG_SIZE, tta="none", batch_size=2):
+    """Warm up the fast stage and the TTA path of the full model; returns milliseconds spent"""
+    dummy = torch.zeros(batch_size, 3, IMG_SIZE, IMG_SIZE)
+    start = time.perf_counter()
+    with torch.no_grad():
+        if slot.fast_model is not None:
+            predict(slot.fast_model, resize_batch(dummy, fast_size), slot.fast_device)
+        if tta != "none":
+            predict(slot.model, dummy, slot.device, tta)
+    return round(1000.0 * (time.perf_counter() - start), 2)
@@ -0,0 +1,129 @@
+"""
+Training Checkpoints and Early Stopping
+Atomic saves of full training state (model, optimizer, scheduler, RNG, epoch)
+so an interrupted run resumes where it stopped
+"""
+
+import os
+import random
+import tempfile
+
+import numpy as np
+import torch
+
+CHECKPOINT_VERSION = 1
+
+
+def current_umask():
+    """The process umask (os.umask can only be read by setting it, so it is restored)"""
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def atomic_save(obj, path):
+    """torch.save to a temp file in the same directory, then rename over `path`"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".pt")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            torch.save(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file 0600; give it the mode a plain open() would
+        os.chmod(tmp_path, 0o666 & ~current_umask())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def rng_state():
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def save_checkpoint(path, model, optimizer, scheduler, epoch, history, best_val_acc, early_stopping, extra=None):
+    """Write the state needed to continue after `epoch` (0-based, completed)"""
+    atomic_save({
+        "version": CHECKPOINT_VERSION,
+        "epoch": epoch,
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "scheduler": scheduler.state_dict(),
+        "history": history,
+        "best_val_acc": best_val_acc,
+        "early_stopping": early_stopping.state_dict(),
+        "rng": rng_state(),
+        "extra": extra or {},
+    }, path)
+
+
+def load_checkpoint(path, model, optimizer, scheduler, early_stopping):
+    """
+    Restore training state from `path` in place.
+
+    Returns (next_epoch, history, best_val_acc, extra).
+    """
+    # RNG and history entries are plain Python objects, so the full unpickler is needed.
+    # Loaded onto the CPU: RNG states must stay CPU ByteTensors, and load_state_dict
+    # copies model and optimizer tensors to wherever the parameters already live.
+    checkpoint = torch.load(path, map_location="cpu", weights_only=False)
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version in {path}")
+    model.load_state_dict(checkpoint["model"])
+    optimizer.load_state_dict(checkpoint["optimizer"])
+    scheduler.load_state_dict(checkpoint["scheduler"])
+    early_stopping.load_state_dict(checkpoint["early_stopping"])
+    set_rng_state(checkpoint["rng"])
+    return checkpoint["epoch"] + 1, checkpoint["history"], checkpoint["best_val_acc"], checkpoint["extra"]
+
+
+class EarlyStopping:
+    """
+    Stop when ReduceLROnPlateau has seen no improvement for `patience` epochs.
+
+    Uses the scheduler's own `best` value, so "improvement" means exactly what
+    it means for learning-rate decay (same mode and threshold). With patience
+    above the scheduler's, the learning rate is reduced at least once first.
+    """
+
+    def __init__(self, scheduler, patience):
+        self.scheduler = scheduler
+        self.patience = patience
+        self.best = None
+        self.bad_epochs = 0
+
+    def step(self):
+        """Call after scheduler.step(); returns True when training should stop"""
+        if self.patience is None or self.patience <= 0:
+            return False
+        if self.best is None or self.scheduler.best != self.best:
+            self.best = self.scheduler.best
+            self.bad_epochs = 0
+        else:
+            self.bad_epochs += 1
+        return self.bad_epochs >= self.patience
+
+    def state_dict(self):
+        return {"best": self.best, "bad_epochs": self.bad_epochs, "patience": self.patience}
+
+    def load_state_dict(self, state):
+        self.best = state["best"]
+        self.bad_epochs = state["bad_epochs"]
@@ -0,0 +1,165 @@
+"""
+Civic Issue Classifier Model and Inference Backends
+Shared model definition plus loaders for eager, TorchScript, ONNX Runtime and int8 models
+"""
+
+import os
+
+import torch
+import torch.nn as nn
+
+IMG_SIZE = 224
+EMBEDDING_DIM = 512
+NORMALIZE_MEAN = [0.485, 0.456, 0.406]
+NORMALIZE_STD = [0.229, 0.224, 0.225]
+
+MODEL_DIR = "model"
+WEIGHTS_PATH = os.path.join(MODEL_DIR, "civic_classifier.pth")
+BEST_WEIGHTS_PATH = os.path.join(MODEL_DIR, "civic_classifier_best.pth")
+
+# Artifacts for the non-eager backends: exported by export.py, except the
+# distilled student, which `train.py --distill` saves as TorchScript
+BACKEND_ARTIFACTS = {
+    "torchscript": os.path.join(MODEL_DIR, "civic_classifier_scripted.pt"),
+    "onnxruntime": os.path.join(MODEL_DIR, "civic_classifier.onnx"),
+    "quantized": os.path.join(MODEL_DIR, "civic_classifier_int8.pt"),
+    "student": os.path.join(MODEL_DIR, "civic_classifier_student.pt"),
+}
+BACKENDS = ("eager",) + tuple(BACKEND_ARTIFACTS)
+
+# Backends that only run on CPU regardless of CUDA availability
+CPU_ONLY_BACKENDS = ("onnxruntime", "quantized")
+
+
+class CivicIssueClassifier(nn.Module):
+    """CNN model for civic issue classification using transfer learning"""
+
+    def __init__(self, num_classes):
+        super(CivicIssueClassifier, self).__init__()
+        # Importing torchvision costs ~2s, so only the eager model pays for it
+        from torchvision import models
+        self.backbone = models.resnet18(weights=None)
+        num_features = self.backbone.fc.in_features
+        self.backbone.fc = nn.Sequential(
+            nn.Dropout(0.5),
+            nn.Linear(num_features, 256),
+            nn.ReLU(),
+            nn.Dropout(0.3),
+            nn.Linear(256, num_classes)
+        )
+
+    def forward(self, x):
+        return self.backbone(x)
+
+    def embed(self, x):
+        """Pooled 512-d backbone features, i.e. the input of the classification head"""
+        backbone = self.backbone
+        x = backbone.maxpool(backbone.relu(backbone.bn1(backbone.conv1(x))))
+        x = backbone.layer4(backbone.layer3(backbone.layer2(backbone.layer1(x))))
+        return torch.flatten(backbone.avgpool(x), 1)
+
+
+class OnnxRuntimeModel:
+    """Callable wrapper that makes an ONNX Runtime session look like a torch model"""
+
+    def __init__(self, path, num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("onnxruntime backend requires: pip install onnxruntime")
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        # Static dims are ints, dynamic ones are names; older exports fixed height and width
+        self.input_shape = self.session.get_inputs()[0].shape
+
+    def __call__(self, batch):
+        outputs = self.session.run(None, {self.input_name: batch.detach().cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+    def eval(self):
+        return self
+
+    def to(self, device):
+        return self
+
+
+def find_weights_path():
+    """Return the best checkpoint if present, otherwise the final weights"""
+    if os.path.exists(BEST_WEIGHTS_PATH):
+        return BEST_WEIGHTS_PATH
+    return WEIGHTS_PATH
+
+
+def load_state_dict(path):
+    """Memory-map a saved state_dict; tensors are paged in from the file on first use"""
+    try:
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except RuntimeError:
+        # Legacy (non-zipfile) checkpoints cannot be memory-mapped
+        return torch.load(path, map_location="cpu", weights_only=True)
+
+
+def build_classifier(path, num_classes, device):
+    """
+    CivicIssueClassifier with the weights at `path`.
+
+    The module is built on the meta device and the loaded tensors are assigned
+    directly, skipping random initialisation and an extra copy of the weights.
+    """
+    with torch.device("meta"):
+        model = CivicIssueClassifier(num_classes)
+    model.load_state_dict(load_state_dict(path), assign=True)
+    return model.to(device).eval()
+
+
+def backend_device(backend, device):
+    """Device the given backend actually runs on"""
+    return torch.device("cpu") if backend in CPU_ONLY_BACKENDS else device
+
+
+def load_classifier(backend, num_classes, device, num_threads=None, path=None):
+    """
+    Load the classifier for the requested backend.
+
+    Returns (model, path). The model is callable on a float (N, 3, H, W) batch
+    and returns logits. `path` overrides the default artifact location.
+    Raises FileNotFoundError if the artifact is missing.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    device = backend_device(backend, device)
+
+    if backend == "eager":
+        path = path or find_weights_path()
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return build_classifier(path, num_classes, device), path
+
+    path = path or BACKEND_ARTIFACTS[backend]
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    if backend == "onnxruntime":
+        return OnnxRuntimeModel(path, num_threads=num_threads), path
+    model = torch.jit.load(path, map_location=device)
+    return model.eval(), path
+
+
+def load_embedder(model, num_classes, device):
+    """
+    Model whose `embed` method returns backbone features.
+
+    The eager model is reused as is. Exported backends only expose logits, so
+    the eager weights are loaded alongside them; raises FileNotFoundError if
+    there are none.
+    """
+    if isinstance(model, CivicIssueClassifier):
+        return model
+    path = find_weights_path()
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    embedder = build_classifier(path, num_classes, device)
+    embedder.backbone.fc = nn.Identity()
+    return embedder
@@ -0,0 +1,270 @@
+"""
+Urban Issues Classifier Evaluation
+Runs saved and exported models over the validation split in large batches and reports
+accuracy, per-class precision/recall, calibration and latency side by side
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from batch_classify import chunked, decode_chunk, init_decoder
+from classifier import BACKEND_ARTIFACTS, BACKENDS, MODEL_DIR, backend_device, load_classifier
+from manifest import even_subsample
+from preprocessing import Preprocessor
+from train import MANIFEST_PATH, download_dataset, load_dataset, split_dataset
+
+REPORT_PATH = os.path.join(MODEL_DIR, "evaluation_report.json")
+ECE_BINS = 15
+
+
+def default_models():
+    """Eager weights plus every exported artifact that exists"""
+    return ["eager"] + [backend for backend, path in BACKEND_ARTIFACTS.items() if os.path.exists(path)]
+
+
+def parse_model_spec(spec):
+    """'backend' or 'backend:path' -> (backend, path or None)"""
+    backend, _, path = spec.partition(":")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}' in '{spec}', expected one of {BACKENDS}")
+    return backend, path or None
+
+
+def decode_split(paths, workers, use_draft):
+    """
+    Decode every validation image once, in parallel, with the serving preprocessor.
+
+    Returns (images, decode_seconds, kept) where images is an (N, H, W, 3) uint8
+    array shared by all models, and kept indexes the paths that decoded.
+    """
+    images, seconds, kept = [], [], []
+    chunk_size = max(1, len(paths) // (4 * workers))
+    with ProcessPoolExecutor(workers, initializer=init_decoder, initargs=(use_draft,)) as pool:
+        chunks = pool.map(decode_chunk, chunked(paths, chunk_size))
+        position = 0
+        for chunk in chunks:
+            for path, image, error, elapsed in chunk:
+                if error is None:
+                    images.append(image)
+                    seconds.append(elapsed)
+                    kept.append(position)
+                else:
+                    print(f"⚠️ Skipping {path}: {error}", file=sys.stderr)
+                position += 1
+    return np.stack(images), np.array(seconds), np.array(kept)
+
+
+def run_model(model, images, preprocessor, device, batch_size):
+    """Softmax probabilities for all images plus the forward-pass seconds of each batch"""
+    with torch.no_grad():
+        model(preprocessor.to_batch(images[:min(batch_size, len(images))]).to(device))  # warm-up
+
+        probabilities, batch_seconds = [], []
+        for start in range(0, len(images), batch_size):
+            batch = preprocessor.to_batch(images[start:start + batch_size]).to(device)
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            began = time.perf_counter()
+            outputs = model(batch)
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            batch_seconds.append(time.perf_counter() - began)
+            probabilities.append(torch.softmax(outputs.float(), dim=1).cpu())
+    return torch.cat(probabilities).numpy(), np.array(batch_seconds)
+
+
+def confusion_matrix(labels, predictions, num_classes):
+    """Rows are true classes, columns predicted classes"""
+    matrix = np.zeros((num_classes, num_classes), dtype=np.int64)
+    np.add.at(matrix, (labels, predictions), 1)
+    return matrix
+
+
+def expected_calibration_error(confidences, correct, bins=ECE_BINS):
+    """
+    Gap between confidence and accuracy, averaged over equal-width confidence bins.
+
+    Returns (ece, reliability) where reliability lists the non-empty bins.
+    """
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    which = np.clip(np.digitize(confidences, edges[1:-1]), 0, bins - 1)
+    ece, reliability = 0.0, []
+    for b in range(bins):
+        mask = which == b
+        if not mask.any():
+            continue
+        accuracy, confidence = correct[mask].mean(), confidences[mask].mean()
+        ece += mask.mean() * abs(accuracy - confidence)
+        reliability.append({
+            "bin": [round(edges[b], 4), round(edges[b + 1], 4)],
+            "count": int(mask.sum()),
+            "accuracy": float(accuracy),
+            "confidence": float(confidence),
+        })
+    return float(ece), reliability
+
+
+def percentiles(values):
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if len(values) else (0.0, 0.0, 0.0)
+    return {"mean": float(np.mean(values)) if len(values) else 0.0,
+            "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def evaluate_model(probabilities, batch_seconds, labels, decode_seconds, class_names, batch_size):
+    """Accuracy, per-class, calibration and latency metrics for one model"""
+    num_classes = len(class_names)
+    predictions = probabilities.argmax(axis=1)
+    confidences = probabilities.max(axis=1)
+    correct = predictions == labels
+    matrix = confusion_matrix(labels, predictions, num_classes)
+
+    true_positives = np.diag(matrix).astype(np.float64)
+    predicted = matrix.sum(axis=0)
+    support = matrix.sum(axis=1)
+    precision = np.divide(true_positives, predicted, out=np.zeros(num_classes), where=predicted > 0)
+    recall = np.divide(true_positives, support, out=np.zeros(num_classes), where=support > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall,
+                   out=np.zeros(num_classes), where=(precision + recall) > 0)
+    ece, reliability = expected_calibration_error(confidences, correct)
+    nll = -np.log(np.maximum(probabilities[np.arange(len(labels)), labels], 1e-12)).mean()
+
+    # Each image is charged its own decode time plus an equal share of its batch's forward pass
+    batch_sizes = np.diff(np.append(np.arange(0, len(labels), batch_size), len(labels)))
+    forward_ms = np.repeat(1000.0 * batch_seconds / batch_sizes, batch_sizes)
+    image_ms = 1000.0 * decode_seconds + forward_ms
+    total_forward = float(batch_seconds.sum())
+
+    per_class = {}
+    for index, name in enumerate(class_names):
+        mask = labels == index
+        per_class[name] = {
+            "support": int(support[index]),
+            "precision": float(precision[index]),
+            "recall": float(recall[index]),
+            "f1": float(f1[index]),
+            "latency_ms": percentiles(image_ms[mask]),
+        }
+
+    return {
+        "accuracy": float(100.0 * correct.mean()),
+        "macro_f1": float(f1[support > 0].mean()),
+        "ece": ece,
+        "nll": float(nll),
+        "mean_confidence": float(confidences.mean()),
+        "throughput_img_per_s": len(labels) / total_forward if total_forward > 0 else 0.0,
+        "forward_ms_per_image": 1000.0 * total_forward / max(len(labels), 1),
+        "batch_latency_ms": percentiles(1000.0 * batch_seconds),
+        "image_latency_ms": percentiles(image_ms),
+        "per_class": per_class,
+        "confusion_matrix": matrix.tolist(),
+        "reliability": reliability,
+    }
+
+
+def print_summary(report, class_names):
+    models = report["models"]
+    print(f"\n📊 {report['num_samples']} validation images, batch size {report['batch_size']}\n")
+    print(f"{'model':<28}{'acc %':>8}{'macro F1':>10}{'ECE':>8}{'img/s':>10}{'p95 batch ms':>14}")
+    for name, result in models.items():
+        print(f"{name[:27]:<28}{result['accuracy']:>8.2f}{result['macro_f1']:>10.3f}{result['ece']:>8.3f}"
+              f"{result['throughput_img_per_s']:>10.1f}{result['batch_latency_ms']['p95']:>14.1f}")
+
+    print(f"\n{'recall / precision':<28}" + "".join(f"{name[:18]:>20}" for name in models))
+    for class_name in class_names:
+        cells = "".join(
+            f"{result['per_class'][class_name]['recall']:>12.2f} / {result['per_class'][class_name]['precision']:.2f}"
+            for result in models.values()
+        )
+        print(f"{class_name[:27]:<28}{cells}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate saved and exported models on the validation split")
+    parser.add_argument("--models", nargs="+",
+                        help="'backend' or 'backend:path', e.g. eager quantized eager:model/pruned.pth "
+                             "(default: eager plus every exported artifact found)")
+    parser.add_argument("--dataset", help="Dataset root (default: Kaggle download/cache from train.py)")
+    parser.add_argument("--manifest", default=MANIFEST_PATH)
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Decode processes (default: cores - 1)")
+    parser.add_argument("--threads", type=int, default=None, help="Torch intra-op threads for the forward pass")
+    parser.add_argument("--max-samples", type=int, help="Limit the validation images used")
+    parser.add_argument("--no-draft", action="store_true", help="Fully decode JPEGs instead of draft mode")
+    parser.add_argument("--output", default=REPORT_PATH)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    specs = args.models or default_models()
+    try:
+        models = [parse_model_spec(spec) for spec in specs]
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    dataset = load_dataset(args.dataset or download_dataset(), args.manifest)
+    _, val_idx = split_dataset(dataset)
+    val_idx = even_subsample(val_idx, args.max_samples)
+    paths = [dataset.samples[i][0] for i in val_idx]
+    labels = np.array([dataset.targets[i] for i in val_idx])
+    class_names = list(dataset.classes)
+
+    print(f"🖼️ Decoding {len(paths)} validation images with {args.workers} workers...")
+    start = time.perf_counter()
+    images, decode_seconds, kept = decode_split(paths, args.workers, not args.no_draft)
+    labels = labels[kept]
+    print(f"  {len(images)} images in {time.perf_counter() - start:.1f}s "
+          f"({1000.0 * decode_seconds.mean():.1f} ms/img per worker)")
+
+    preprocessor = Preprocessor()
+    report = {
+        "num_samples": int(len(labels)),
+        "batch_size": args.batch_size,
+        "classes": class_names,
+        "device": str(device),
+        "threads": torch.get_num_threads(),
+        "draft_decode": not args.no_draft,
+        "decode_ms": percentiles(1000.0 * decode_seconds),
+        "models": {},
+    }
+    for spec, (backend, path) in zip(specs, models):
+        try:
+            model, model_path = load_classifier(backend, len(class_names), device,
+                                                num_threads=args.threads, path=path)
+        except FileNotFoundError as e:
+            print(f"⚠️ Skipping {spec}: {e} not found")
+            continue
+        print(f"⏱️ Evaluating {spec} ({model_path})...")
+        probabilities, batch_seconds = run_model(
+            model, images, preprocessor, backend_device(backend, device), args.batch_size
+        )
+        result = evaluate_model(probabilities, batch_seconds, labels, decode_seconds, class_names, args.batch_size)
+        report["models"][spec] = {"backend": backend, "path": model_path, **result}
+        del model
+
+    if not report["models"]:
+        print("❌ No model could be evaluated")
+        return 1
+    print_summary(report, class_names)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Evaluation report saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+Urban Issues Classifier Export Script
+Exports the trained PyTorch model to TorchScript, ONNX and int8 quantized variants
+and reports their accuracy against the eager model on the validation split
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from classifier import BACKEND_ARTIFACTS, IMG_SIZE, MODEL_DIR, load_classifier
+from manifest import even_subsample
+from train import download_dataset, get_data_transforms, load_dataset, split_dataset
+
+DEVICE = torch.device("cpu")
+EXPORT_FORMATS = ("torchscript", "onnx", "quantized")
+REPORT_PATH = os.path.join(MODEL_DIR, "export_report.json")
+
+
+def load_num_classes():
+    """Read num_classes from the saved class mappings"""
+    with open(os.path.join(MODEL_DIR, "class_mappings.json"), "r") as f:
+        return json.load(f).get("num_classes", 9)
+
+
+def build_split_loaders(dataset_path, batch_size, num_workers, max_samples=None):
+    """Rebuild the training split (for calibration) and validation split with inference transforms"""
+    _, val_transform = get_data_transforms()
+    full_dataset = load_dataset(dataset_path)
+    train_idx, val_idx = split_dataset(full_dataset)
+    val_idx = even_subsample(val_idx, max_samples)
+    train_subset = full_dataset.subset(train_idx, val_transform)
+    val_subset = full_dataset.subset(val_idx, val_transform)
+    calib_loader = DataLoader(train_subset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+    val_loader = DataLoader(val_subset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    return calib_loader, val_loader
+
+
+def export_torchscript(model, example):
+    path = BACKEND_ARTIFACTS["torchscript"]
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    traced = torch.jit.freeze(traced)
+    traced.save(path)
+    print(f"✅ TorchScript model saved to {path}")
+
+
+def export_onnx(model, example):
+    path = BACKEND_ARTIFACTS["onnxruntime"]
+    torch.onnx.export(
+        model,
+        (example,),
+        path,
+        input_names=["input"],
+        output_names=["logits"],
+        # Height and width stay dynamic so a cascade stage can run it below IMG_SIZE
+        dynamic_axes={"input": {0: "batch", 2: "height", 3: "width"}, "logits": {0: "batch"}},
+        opset_version=17,
+        # The TorchScript-based exporter, which honours dynamic_axes and does
+        # not need onnxscript like the dynamo exporter newer torch defaults to
+        dynamo=False
+    )
+    print(f"✅ ONNX model saved to {path}")
+
+
+def quantize_dynamic(model):
+    """int8 weights for Linear layers, activations quantized on the fly"""
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static(model, example, calib_loader, calibration_batches):
+    """int8 weights and activations for the whole network via FX graph mode, calibrated on training images"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+    prepared = prepare_fx(model, qconfig_mapping, (example,))
+    print(f"📏 Calibrating on {calibration_batches} batches...")
+    with torch.no_grad():
+        for batch_idx, (inputs, _) in enumerate(calib_loader):
+            if batch_idx >= calibration_batches:
+                break
+            prepared(inputs)
+    return convert_fx(prepared)
+
+
+def export_quantized(model, example, mode, calib_loader, calibration_batches):
+    path = BACKEND_ARTIFACTS["quantized"]
+    if mode == "static":
+        quantized = quantize_static(model, example, calib_loader, calibration_batches)
+    else:
+        quantized = quantize_dynamic(model)
+    with torch.no_grad():
+        traced = torch.jit.trace(quantized, example)
+    traced.save(path)
+    print(f"✅ int8 ({mode}) quantized model saved to {path}")
+
+
+def evaluate(model, loader):
+    """Return predictions, labels and mean latency per image for one backend"""
+    predictions, labels = [], []
+    elapsed = 0.0
+    with torch.no_grad():
+        for inputs, targets in loader:
+            start = time.perf_counter()
+            outputs = model(inputs)
+            elapsed += time.perf_counter() - start
+            predictions.append(outputs.argmax(dim=1))
+            labels.append(targets)
+    predictions, labels = torch.cat(predictions), torch.cat(labels)
+    return predictions, labels, 1000.0 * elapsed / max(len(labels), 1)
+
+
+def accuracy_report(backends, num_classes, val_loader):
+    """Compare each backend's validation accuracy and latency against the eager model"""
+    print(f"\n📊 Evaluating on {len(val_loader.dataset)} validation images...")
+    eager, _ = load_classifier("eager", num_classes, DEVICE)
+    eager_preds, labels, eager_ms = evaluate(eager, val_loader)
+    eager_acc = 100.0 * eager_preds.eq(labels).float().mean().item()
+    report = {
+        "num_samples": len(labels),
+        "engine": torch.backends.quantized.engine,
+        "backends": {
+            "eager": {"accuracy": eager_acc, "accuracy_delta": 0.0, "agreement": 100.0,
+                      "ms_per_image": eager_ms, "speedup": 1.0}
+        }
+    }
+    print(f"  eager: Acc {eager_acc:.2f}% | {eager_ms:.2f} ms/img")
+
+    for backend in backends:
+        model, _ = load_classifier(backend, num_classes, DEVICE)
+        preds, _, ms = evaluate(model, val_loader)
+        acc = 100.0 * preds.eq(labels).float().mean().item()
+        agreement = 100.0 * preds.eq(eager_preds).float().mean().item()
+        report["backends"][backend] = {
+            "accuracy": acc,
+            "accuracy_delta": acc - eager_acc,
+            "agreement": agreement,
+            "ms_per_image": ms,
+            "speedup": eager_ms / ms if ms > 0 else 0.0
+        }
+        print(f"  {backend}: Acc {acc:.2f}% ({acc - eager_acc:+.2f}) | "
+              f"agrees with eager on {agreement:.2f}% | {ms:.2f} ms/img ({eager_ms / ms:.2f}x)")
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export optimized inference models")
+    parser.add_argument("--formats", nargs="+", choices=EXPORT_FORMATS, default=list(EXPORT_FORMATS),
+                        help="Artifacts to export (default: all)")
+    parser.add_argument("--quantization", choices=("dynamic", "static"), default="static",
+                        help="dynamic: int8 Linear layers only; static: whole network, needs calibration data")
+    parser.add_argument("--dataset", help="Dataset root (default: Kaggle download/cache from train.py)")
+    parser.add_argument("--calibration-batches", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-workers", type=int, default=0)
+    parser.add_argument("--max-samples", type=int, help="Limit the validation images used for the report")
+    parser.add_argument("--skip-report", action="store_true", help="Export only, no accuracy report")
+    parser.add_argument("--max-accuracy-drop", type=float, default=1.0,
+                        help="Fail if any backend loses more than this many accuracy points")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    num_classes = load_num_classes()
+    model, weights_path = load_classifier("eager", num_classes, DEVICE)
+    print(f"📦 Exporting from {weights_path}")
+    example = torch.randn(1, 3, IMG_SIZE, IMG_SIZE)
+
+    needs_data = not args.skip_report or ("quantized" in args.formats and args.quantization == "static")
+    calib_loader = val_loader = None
+    if needs_data:
+        dataset_path = args.dataset or download_dataset()
+        calib_loader, val_loader = build_split_loaders(
+            dataset_path, args.batch_size, args.num_workers, args.max_samples
+        )
+
+    with warnings.catch_warnings():
+        # torch.ao.quantization and the TorchScript exporter emit deprecation notices
+        warnings.simplefilter("ignore", DeprecationWarning)
+        if "torchscript" in args.formats:
+            export_torchscript(model, example)
+        if "onnx" in args.formats:
+            export_onnx(model, example)
+        if "quantized" in args.formats:
+            export_quantized(model, example, args.quantization, calib_loader, args.calibration_batches)
+
+    if args.skip_report:
+        return 0
+
+    backends = [("onnxruntime" if fmt == "onnx" else fmt) for fmt in args.formats]
+    report = accuracy_report(backends, num_classes, val_loader)
+    report["quantization"] = args.quantization
+    with open(REPORT_PATH, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Export report saved to {REPORT_PATH}")
+
+    failed = [name for name, result in report["backends"].items()
+              if result["accuracy_delta"] < -args.max_accuracy_drop]
+    if failed:
+        print(f"❌ Accuracy dropped more than {args.max_accuracy_drop} points for: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Frozen-Backbone Feature Cache
+Runs the ResNet-18 backbone once over the dataset, stores the 512-d pooled
+features on disk and trains only the classifier head on them
+"""
+
+import copy
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader, TensorDataset
+
+FEATURES_FILE = "features.npy"
+INDEX_FILE = "index.json"
+
+
+def weights_fingerprint(path):
+    """Identify backbone weights by path, size and mtime ("imagenet" if none)"""
+    if not path:
+        return "imagenet"
+    stat = os.stat(path)
+    return hashlib.sha256(f"{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}".encode()).hexdigest()
+
+
+def module_fingerprint(module):
+    """
+    Content hash of a module's parameters and buffers.
+
+    Unlike weights_fingerprint it survives the weights file being rewritten
+    with the same tensors, e.g. by a head-only run saving its new head.
+    """
+    digest = hashlib.sha256()
+    for name, tensor in sorted(module.state_dict().items()):
+        tensor = tensor.detach().cpu().contiguous().reshape(-1)
+        digest.update(f"{name}\0{tensor.dtype}\0{tensor.numel()}\n".encode())
+        digest.update(tensor.view(torch.uint8).numpy().tobytes())
+    return digest.hexdigest()
+
+
+def extract_features(backbone, loader, device):
+    """Run the frozen backbone over `loader`, returning the features as a numpy array"""
+    backbone.eval()
+    features = []
+    start = time.perf_counter()
+    with torch.no_grad():
+        for batch_idx, (inputs, _) in enumerate(loader):
+            features.append(backbone(inputs.to(device)).float().cpu().numpy())
+            if (batch_idx + 1) % 50 == 0:
+                done = sum(len(f) for f in features)
+                print(f"  Extracted {done} features ({done / (time.perf_counter() - start):.1f} img/s)")
+    return np.concatenate(features)
+
+
+def build_feature_cache(cache_dir, fingerprint, keys, backbone, loader, device):
+    """
+    Return features aligned with `keys`, computing them only if the cache is missing or stale.
+
+    `fingerprint` must change whenever the backbone weights or input transform
+    change; `keys` identify each image in `loader` by content (e.g. SHA-256),
+    so labels are left to the caller and relabelling or moving images keeps
+    the cache. Features are memory-mapped on an exact reuse.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, INDEX_FILE)
+    features_path = os.path.join(cache_dir, FEATURES_FILE)
+    keys = list(keys)
+
+    if os.path.exists(index_path):
+        with open(index_path, "r") as f:
+            index = json.load(f)
+        if index.get("fingerprint") == fingerprint:
+            rows = {key: row for row, key in enumerate(index["keys"])}
+            if all(key in rows for key in keys):
+                print(f"✅ Reusing feature cache at {cache_dir} ({len(keys)} x {index['dim']})")
+                features = np.load(features_path, mmap_mode="r")
+                if index["keys"] == keys:
+                    return features
+                return features[[rows[key] for key in keys]]
+        os.remove(index_path)
+
+    print(f"🧊 Extracting backbone features for {len(loader.dataset)} images...")
+    features = extract_features(backbone, loader, device)
+    np.save(features_path, features)
+    # The index is written last, so an interrupted build is never mistaken for a valid cache
+    with open(index_path, "w") as f:
+        json.dump({"fingerprint": fingerprint, "keys": keys, "dim": features.shape[1]}, f)
+    print(f"✅ Feature cache saved to {cache_dir}")
+    return features
+
+
+def train_head(head, train_features, train_labels, val_features, val_labels, device,
+               epochs=30, batch_size=256, learning_rate=0.001):
+    """
+    Train the classifier head on cached features.
+
+    Returns (best_head_state, history) where the best state is chosen by
+    validation accuracy.
+    """
+    head = head.to(device)
+    train_loader = DataLoader(
+        TensorDataset(torch.as_tensor(np.asarray(train_features)), torch.as_tensor(train_labels)),
+        batch_size=batch_size, shuffle=True
+    )
+    val_inputs = torch.as_tensor(np.asarray(val_features)).to(device)
+    val_targets = torch.as_tensor(val_labels).to(device)
+
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(head.parameters(), lr=learning_rate)
+    history = {"train_loss": [], "train_acc": [], "val_loss": [], "val_acc": []}
+    best_val_acc, best_state = -1.0, None
+
+    for epoch in range(epochs):
+        head.train()
+        train_loss, train_correct = 0.0, 0
+        for inputs, targets in train_loader:
+            inputs, targets = inputs.to(device), targets.to(device)
+            optimizer.zero_grad(set_to_none=True)
+            outputs = head(inputs)
+            loss = criterion(outputs, targets)
+            loss.backward()
+            optimizer.step()
+            train_loss += loss.item() * len(targets)
+            train_correct += outputs.argmax(1).eq(targets).sum().item()
+
+        head.eval()
+        with torch.no_grad():
+            outputs = head(val_inputs)
+            val_loss = criterion(outputs, val_targets).item()
+            val_acc = 100.0 * outputs.argmax(1).eq(val_targets).float().mean().item()
+
+        train_total = len(train_loader.dataset)
+        history["train_loss"].append(train_loss / train_total)
+        history["train_acc"].append(100.0 * train_correct / train_total)
+        history["val_loss"].append(val_loss)
+        history["val_acc"].append(val_acc)
+        if val_acc > best_val_acc:
+            best_val_acc, best_state = val_acc, copy.deepcopy(head.state_dict())
+        print(f"Head epoch {epoch+1}/{epochs}: Train Loss: {history['train_loss'][-1]:.4f}, "
+              f"Train Acc: {history['train_acc'][-1]:.2f}% | Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}%")
+
+    return best_state, history
@@ -0,0 +1,160 @@
+"""
+Streaming Upload Ingestion
+Bounded request bodies, header sniffing and dimension checks that reject bad
+uploads before they are fully read into memory or decoded
+"""
+
+import hashlib
+import json
+import threading
+
+from fastapi import HTTPException
+from PIL import Image
+
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the formats the preprocessor accepts
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+)
+
+
+class UploadRejected(Exception):
+    """An upload that fails validation; `status_code` is the HTTP status to answer with"""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_format(header):
+    """Image format from the first bytes of a file, or None if it is not a supported image"""
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    return None
+
+
+_local = threading.local()
+
+
+def _chunk_buffer():
+    """Per-thread read buffer, reused for every upload handled on that thread"""
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        buffer = _local.buffer = bytearray(CHUNK_SIZE)
+    return buffer
+
+
+def _read_chunk(fileobj, buffer):
+    """readinto() for any file object; SpooledTemporaryFile only has it from Python 3.11"""
+    readinto = getattr(fileobj, "readinto", None)
+    if readinto is not None:
+        return readinto(buffer)
+    chunk = fileobj.read(len(buffer))
+    buffer[:len(chunk)] = chunk
+    return len(chunk)
+
+
+def inspect_upload(fileobj, max_bytes, max_pixels):
+    """
+    Validate an image file in place and return (sha256 hex digest, size in bytes).
+
+    The file is streamed through a reused fixed-size buffer, so no copy of the
+    whole upload is made: the first chunk must carry a known image signature,
+    the total size must stay within `max_bytes`, and the dimensions read from
+    the header must stay within `max_pixels` before anything is decoded.
+    Leaves the file at position 0. Raises UploadRejected.
+    """
+    buffer = _chunk_buffer()
+    view = memoryview(buffer)
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    while True:
+        count = _read_chunk(fileobj, buffer)
+        if not count:
+            break
+        # The buffer is reused, so only the bytes just read belong to this upload
+        if size == 0 and sniff_format(bytes(view[:min(count, 16)])) is None:
+            raise UploadRejected(415, "Unsupported file type, expected a JPEG, PNG, WebP, GIF, BMP or TIFF image")
+        size += count
+        if size > max_bytes:
+            raise UploadRejected(413, f"Upload exceeds the {max_bytes} byte limit")
+        digest.update(view[:count])
+    if size == 0:
+        raise UploadRejected(400, "Empty upload")
+
+    fileobj.seek(0)
+    try:
+        # Image.open only parses the header; pixels are decoded later
+        with Image.open(fileobj) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        width = height = None
+    except Exception as e:
+        raise UploadRejected(400, f"Unreadable image: {e}")
+    finally:
+        fileobj.seek(0)
+    if width is None or width * height > max_pixels:
+        raise UploadRejected(413, f"Image dimensions exceed the {max_pixels} pixel limit")
+    return digest.hexdigest(), size
+
+
+class RequestBodyLimit:
+    """
+    ASGI middleware capping request body size per route.
+
+    A Content-Length over the limit is answered with 413 before the body is
+    read; chunked bodies are counted as they stream in and the request fails
+    with 413 once the limit is crossed, before multipart parsing finishes.
+    `limits` maps a path to its maximum body size in bytes.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI re-raises HTTPExceptions from body parsing unchanged
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds the {limit} byte limit")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    async def _reject(send, limit):
+        body = json.dumps({"detail": f"Request body exceeds the {limit} byte limit"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
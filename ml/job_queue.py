@@ -0,0 +1,195 @@
+"""
+Persistent Job Queue for Asynchronous Classification
+SQLite-backed queue of submitted images that workers claim in batches, so bursts
+are stored on disk and drained at full batch size instead of timing out
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    sha TEXT,
+    options TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """
+    Classification jobs in `jobs_dir/jobs.db` with their images in `jobs_dir/images/`.
+
+    Jobs go queued -> running -> done/failed. A claim leases a job for
+    `lease_seconds`; jobs whose lease expires (the worker died) are claimed
+    again, up to `max_attempts` times. Several server processes may share one
+    directory: claims run in an IMMEDIATE transaction so each job is handed
+    out once. Methods block and are meant to run off the event loop.
+    """
+
+    def __init__(self, jobs_dir, lease_seconds=120.0, max_attempts=3, ttl_seconds=86400.0):
+        self.jobs_dir = jobs_dir
+        self.images_dir = os.path.join(jobs_dir, "images")
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        os.makedirs(self.images_dir, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        """One connection per thread, in autocommit mode with WAL for concurrent readers"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(os.path.join(self.jobs_dir, "jobs.db"), timeout=30.0,
+                                         isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def image_path(self, job_id):
+        return os.path.join(self.images_dir, job_id)
+
+    def submit(self, fileobj, sha=None, options=None):
+        """Copy the image to disk and queue a job for it; returns the job id"""
+        job_id = uuid.uuid4().hex
+        path = self.image_path(job_id)
+        fileobj.seek(0)
+        with open(path + ".tmp", "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        os.replace(path + ".tmp", path)
+        self._connection().execute(
+            "INSERT INTO jobs (id, status, sha, options, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, QUEUED, sha, json.dumps(options or {}), time.time())
+        )
+        return job_id
+
+    def claim(self, limit):
+        """
+        Lease up to `limit` of the oldest claimable jobs.
+
+        Returns [(job_id, image_path, sha, options)]. Jobs whose lease expired
+        too many times are failed instead of being handed out again.
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? "
+                "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, "Worker did not finish the job", RUNNING, now, self.max_attempts)
+            )
+            rows = connection.execute(
+                "SELECT id, sha, options FROM jobs WHERE status = ? OR (status = ? AND lease_until < ?) "
+                "ORDER BY created_at LIMIT ?",
+                (QUEUED, RUNNING, now, limit)
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET status = ?, started_at = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                [(RUNNING, now, now + self.lease_seconds, row["id"]) for row in rows]
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return [(row["id"], self.image_path(row["id"]), row["sha"], json.loads(row["options"])) for row in rows]
+
+    def release(self, job_ids):
+        """Put claimed jobs back in the queue without counting the attempt (e.g. the inference queue was full)"""
+        self._connection().executemany(
+            "UPDATE jobs SET status = ?, lease_until = NULL, attempts = attempts - 1 WHERE id = ? AND status = ?",
+            [(QUEUED, job_id, RUNNING) for job_id in job_ids]
+        )
+
+    def finish(self, outcomes):
+        """Record [(job_id, result or None, error or None)] and delete the finished images"""
+        now = time.time()
+        self._connection().executemany(
+            "UPDATE jobs SET status = ?, finished_at = ?, lease_until = NULL, result = ?, error = ? WHERE id = ?",
+            [
+                (FAILED if error is not None else DONE, now,
+                 json.dumps(result) if result is not None else None, error, job_id)
+                for job_id, result, error in outcomes
+            ]
+        )
+        for job_id, _, _ in outcomes:
+            try:
+                os.remove(self.image_path(job_id))
+            except FileNotFoundError:
+                pass
+
+    def get(self, job_id):
+        """Job status as a response dict, or None if the id is unknown (or expired)"""
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "attempts": row["attempts"],
+        }
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        if row["error"] is not None:
+            job["error"] = row["error"]
+        return job
+
+    def position(self, created_at):
+        """Number of queued jobs ahead of this one"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (QUEUED, created_at)
+        ).fetchone()[0]
+
+    def pending(self):
+        """Jobs queued or running"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+        ).fetchone()[0]
+
+    def purge(self):
+        """Drop finished jobs older than the TTL with any image left behind; returns how many were removed"""
+        connection = self._connection()
+        cutoff = time.time() - self.ttl_seconds
+        expired = [row[0] for row in connection.execute(
+            "SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, cutoff)
+        )]
+        connection.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, cutoff))
+        for job_id in expired:
+            try:
+                os.remove(self.image_path(job_id))
+            except FileNotFoundError:
+                pass
+        return len(expired)
+
+    def stats(self):
+        counts = dict(self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            "counts": {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)},
+            "path": self.jobs_dir,
+        }
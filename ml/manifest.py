@@ -0,0 +1,181 @@
+"""
+Indexed Dataset Manifest
+Scans an ImageFolder-style dataset once into a compact index (path, label,
+size, mtime, content hash), updates it incrementally and provides
+deterministic stratified splits
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+from torch.utils.data import Dataset
+
+MANIFEST_VERSION = 1
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".ppm", ".bmp", ".pgm", ".tif", ".tiff", ".webp")
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _directory_mtimes(root, classes):
+    """mtime of the root and every directory under each class; adding or removing a file changes one of them"""
+    mtimes = {".": os.stat(root).st_mtime_ns}
+    for class_name in classes:
+        for dirpath, _, _ in os.walk(os.path.join(root, class_name), followlinks=True):
+            mtimes[os.path.relpath(dirpath, root)] = os.stat(dirpath).st_mtime_ns
+    return mtimes
+
+
+def _find_classes(root):
+    return sorted(entry.name for entry in os.scandir(root) if entry.is_dir())
+
+
+def _scan_files(root, classes):
+    """[(relative_path, label)] in ImageFolder order"""
+    files = []
+    for label, class_name in enumerate(classes):
+        for dirpath, _, filenames in sorted(os.walk(os.path.join(root, class_name), followlinks=True)):
+            for name in sorted(filenames):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    files.append((os.path.relpath(os.path.join(dirpath, name), root), label))
+    return files
+
+
+def build_manifest(root, manifest_path, hash_workers=8):
+    """
+    Load or (incrementally) rebuild the manifest for `root` at `manifest_path`.
+
+    When no directory mtime changed the stored manifest is returned without
+    walking the tree's files. Otherwise files are rescanned and only new or
+    modified files (by size/mtime) are re-hashed.
+    """
+    root = os.path.abspath(root)
+    classes = _find_classes(root)
+    previous = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            previous = json.load(f)
+        if previous.get("version") != MANIFEST_VERSION or previous.get("root") != root:
+            previous = None
+
+    mtimes = _directory_mtimes(root, classes)
+    if previous is not None and previous["classes"] == classes and previous["directories"] == mtimes:
+        print(f"✅ Reusing dataset manifest {manifest_path} ({len(previous['paths'])} images)")
+        return previous
+
+    known = {}
+    if previous is not None:
+        for path, size, mtime, sha in zip(previous["paths"], previous["sizes"], previous["mtimes"], previous["hashes"]):
+            known[path] = (size, mtime, sha)
+
+    files = _scan_files(root, classes)
+    stats = [os.stat(os.path.join(root, path)) for path, _ in files]
+    to_hash = [
+        i for i, ((path, _), stat) in enumerate(zip(files, stats))
+        if known.get(path, (None, None, None))[:2] != (stat.st_size, stat.st_mtime_ns)
+    ]
+    print(f"🔎 Indexing dataset: {len(files)} images, {len(to_hash)} new or changed")
+    hashes = [known[path][2] if path in known else None for path, _ in files]
+    with ThreadPoolExecutor(max_workers=hash_workers) as pool:
+        for i, sha in zip(to_hash, pool.map(lambda i: file_sha256(os.path.join(root, files[i][0])), to_hash)):
+            hashes[i] = sha
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "root": root,
+        "classes": classes,
+        "directories": mtimes,
+        "paths": [path for path, _ in files],
+        "labels": [label for _, label in files],
+        "sizes": [stat.st_size for stat in stats],
+        "mtimes": [stat.st_mtime_ns for stat in stats],
+        "hashes": hashes,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(tmp_path, manifest_path)
+    print(f"✅ Dataset manifest saved to {manifest_path}")
+    return manifest
+
+
+def stratified_split(labels, val_fraction, seed):
+    """
+    Deterministic per-class split into (train_indices, val_indices).
+
+    Each class contributes round(val_fraction * n) validation images (at
+    least one when it has two or more), shuffled with a fixed seed.
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    train_idx, val_idx = [], []
+    for label in np.unique(labels):
+        indices = np.flatnonzero(labels == label)
+        rng.shuffle(indices)
+        n_val = int(round(val_fraction * len(indices)))
+        if len(indices) > 1:
+            n_val = min(max(n_val, 1), len(indices) - 1)
+        val_idx.extend(indices[:n_val].tolist())
+        train_idx.extend(indices[n_val:].tolist())
+    return sorted(train_idx), sorted(val_idx)
+
+
+def even_subsample(indices, max_samples):
+    """
+    At most `max_samples` evenly spaced entries of `indices`.
+
+    Positions span the whole list, so when indices are grouped by class every
+    class keeps roughly its share instead of the tail classes being cut off.
+    """
+    if not max_samples or max_samples >= len(indices):
+        return list(indices)
+    positions = np.linspace(0, len(indices) - 1, max_samples).astype(int)
+    return [indices[i] for i in positions]
+
+
+class ManifestDataset(Dataset):
+    """
+    ImageFolder-compatible dataset over a manifest.
+
+    Exposes `classes`, `class_to_idx`, `samples` and `targets` like
+    ImageFolder, plus the SHA-256 of every image as `hashes`. Splits are separate instances (see `subset`), so each gets
+    its own transform.
+    """
+
+    def __init__(self, manifest, transform=None, indices=None):
+        self.manifest = manifest
+        self.root = manifest["root"]
+        self.classes = manifest["classes"]
+        self.class_to_idx = {name: idx for idx, name in enumerate(self.classes)}
+        self.transform = transform
+        self.indices = list(range(len(manifest["paths"]))) if indices is None else list(indices)
+        self.samples = [
+            (os.path.join(self.root, manifest["paths"][i]), manifest["labels"][i]) for i in self.indices
+        ]
+        self.targets = [label for _, label in self.samples]
+        self.hashes = [manifest["hashes"][i] for i in self.indices]
+
+    def subset(self, indices, transform=None):
+        """New dataset over `indices` (positions within this dataset) with its own transform"""
+        return ManifestDataset(self.manifest, transform, [self.indices[i] for i in indices])
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        path, label = self.samples[idx]
+        with Image.open(path) as image:
+            image = image.convert("RGB")
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, label
@@ -0,0 +1,190 @@
+"""
+Versioned Model Slots for the Classifier API
+Background loading, warm-up, canary checks and atomic swap/rollback of models
+"""
+
+import os
+import time
+
+import torch
+
+from classifier import IMG_SIZE
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+class CanaryCheckError(Exception):
+    """Raised when a freshly loaded model fails warm-up or the canary check"""
+
+
+class CategoryTable:
+    """
+    Response metadata for every class index, precomputed when a model loads.
+
+    `metadata[i]` holds the fields describing class i in a /predict response
+    and `labels[i]` its category code for ranked predictions, so building a
+    response is list indexing instead of string-keyed lookups.
+    """
+
+    def __init__(self, class_mappings, num_classes, descriptions, legacy_map):
+        index_to_category = (class_mappings or {}).get("index_to_category")
+        self.has_mappings = index_to_category is not None
+        self.labels = []
+        self.metadata = []
+        for idx in range(num_classes):
+            info = (index_to_category or {}).get(str(idx))
+            category = info.get("category", "UNKNOWN") if info else "UNKNOWN"
+            self.labels.append(info.get("category", f"CLASS_{idx}") if info else f"CLASS_{idx}")
+            self.metadata.append({
+                "category": category,
+                "category_name": info.get("original_name", "Unknown") if info else "Unknown",
+                "description": descriptions.get(category, "Civic issue detected"),
+                "department": info.get("department", "General Municipal Department") if info else "General Municipal Department",
+                "priority": info.get("priority", "medium") if info else "medium",
+                "legacy_category": legacy_map.get(category, "other"),
+            })
+
+
+class ModelSlot:
+    """One loaded model version together with the mappings it was trained with"""
+
+    def __init__(self, version, model, class_mappings, backend, device, path):
+        self.version = version
+        self.model = model
+        self.class_mappings = class_mappings
+        self.backend = backend
+        self.device = device
+        self.path = path
+        self.loaded_at = time.time()
+        self.warmup_ms = None
+        self.canary = None
+        # Eager model used for /embed and /similar (None if unavailable)
+        self.embedder = None
+        self.embedder_id = None
+        # Cheap first-stage model of a cascade (may be `model` itself at a lower resolution)
+        self.fast_model = None
+        self.fast_backend = None
+        self.fast_device = None
+        # CategoryTable, filled in by the service that owns the slot
+        self.categories = None
+
+    @property
+    def num_classes(self):
+        if self.class_mappings:
+            return self.class_mappings.get("num_classes", 9)
+        return 9
+
+    def info(self):
+        return {
+            "version": self.version,
+            "backend": self.backend,
+            "device": str(self.device),
+            "path": self.path,
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.loaded_at)),
+            "warmup_ms": self.warmup_ms,
+            "canary": self.canary,
+            "embeddings": self.embedder is not None,
+            "cascade": self.fast_backend,
+        }
+
+
+def warm_up(slot, batch_size=2):
+    """Run a dummy forward pass so the first real request does not pay for lazy init"""
+    dummy = torch.zeros(batch_size, 3, IMG_SIZE, IMG_SIZE)
+    start = time.perf_counter()
+    with torch.no_grad():
+        outputs = slot.model(dummy.to(slot.device))
+    slot.warmup_ms = round(1000.0 * (time.perf_counter() - start), 2)
+    if tuple(outputs.shape) != (batch_size, slot.num_classes):
+        raise CanaryCheckError(
+            f"Model output shape {tuple(outputs.shape)} does not match {slot.num_classes} classes"
+        )
+    if not torch.isfinite(outputs).all():
+        raise CanaryCheckError("Model produced non-finite outputs during warm-up")
+
+
+def load_canary_set(canary_dir, class_mappings, preprocess):
+    """
+    Load labelled canary images from `canary_dir/<class>/*.jpg`.
+
+    Folder names may be dataset class names ("Garbage") or category codes
+    ("GARBAGE"). Returns (batch, labels) or None if there is no canary set.
+    """
+    if not canary_dir or not os.path.isdir(canary_dir) or not class_mappings:
+        return None
+    label_for = {}
+    for idx, info in class_mappings.get("index_to_category", {}).items():
+        label_for[info.get("original_name")] = int(idx)
+        label_for[info.get("category")] = int(idx)
+
+    tensors, labels = [], []
+    for folder in sorted(os.listdir(canary_dir)):
+        folder_path = os.path.join(canary_dir, folder)
+        if folder not in label_for or not os.path.isdir(folder_path):
+            continue
+        for name in sorted(os.listdir(folder_path)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            with open(os.path.join(folder_path, name), "rb") as f:
+                tensors.append(preprocess(f.read()))
+            labels.append(label_for[folder])
+    if not tensors:
+        return None
+    return torch.stack(tensors), torch.tensor(labels)
+
+
+def check_canary(slot, canary, min_accuracy):
+    """Score the slot on the canary set and reject it below `min_accuracy` (0-1)"""
+    if canary is None:
+        slot.canary = {"checked": False}
+        return
+    batch, labels = canary
+    with torch.no_grad():
+        predictions = slot.model(batch.to(slot.device)).argmax(dim=1).cpu()
+    accuracy = predictions.eq(labels).float().mean().item()
+    slot.canary = {"checked": True, "images": len(labels), "accuracy": round(accuracy, 4)}
+    if accuracy < min_accuracy:
+        raise CanaryCheckError(
+            f"Canary accuracy {accuracy:.2%} is below the required {min_accuracy:.2%}"
+        )
+
+
+class ModelRegistry:
+    """
+    Holds the active model slot plus the previous one for rollback.
+
+    Swaps are plain attribute assignments made from the event loop, so a batch
+    that already picked up `active` keeps running on that version while new
+    batches see the replacement.
+    """
+
+    def __init__(self):
+        self.active = None
+        self.previous = None
+        self.loading = None
+        self.last_error = None
+        self._counter = 0
+
+    def next_version(self):
+        self._counter += 1
+        return f"v{self._counter}"
+
+    def activate(self, slot):
+        if self.active is not None and self.active is not slot:
+            self.previous = self.active
+        self.active = slot
+        self.last_error = None
+
+    def rollback(self):
+        if self.previous is None:
+            raise LookupError("No previous model version to roll back to")
+        self.active, self.previous = self.previous, self.active
+        return self.active
+
+    def status(self):
+        return {
+            "active": self.active.info() if self.active else None,
+            "previous": self.previous.info() if self.previous else None,
+            "loading": self.loading,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,131 @@
+"""
+Prediction Cache for the Classifier API
+Bounded LRU/TTL cache of /predict responses keyed by content and perceptual hashes
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+
+def content_hash(contents):
+    """SHA-256 of the raw uploaded bytes"""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def perceptual_hash(image, hash_size=8):
+    """
+    64-bit difference hash (dHash) of a decoded image.
+
+    Recompressed or lightly resized copies of the same photo usually map to
+    the same value, which lets them share a cached prediction.
+    """
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+class PredictionCache:
+    """
+    LRU cache with per-entry TTL for prediction responses.
+
+    Entries are stored under a "sha:" key and, when `use_perceptual` is set,
+    a "phash:" key that point at the same response. Lookups happen in two
+    steps: `get` by content hash before decoding, then `get_perceptual` once
+    the image has been decoded. Not thread-safe: it is only touched from the
+    event loop.
+    """
+
+    def __init__(self, max_entries=2048, ttl_seconds=3600.0, use_perceptual=False):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self.use_perceptual = bool(use_perceptual)
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped on clear() so results computed by an older model are not stored
+        self.generation = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if self.ttl > 0 and expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, sha):
+        """Look up a response by content hash"""
+        if not self.enabled:
+            return None
+        value = self._get("sha:" + sha)
+        if value is not None:
+            self.hits += 1
+        elif not self.use_perceptual:
+            self.misses += 1
+        return value
+
+    def get_perceptual(self, phash, sha=None):
+        """Look up a response by perceptual hash, aliasing it under `sha` on a hit"""
+        if not self.enabled or not self.use_perceptual:
+            return None
+        value = self._get("phash:" + phash)
+        if value is None:
+            self.misses += 1
+            return None
+        self.perceptual_hits += 1
+        if sha is not None:
+            self._put("sha:" + sha, value)
+        return value
+
+    def _put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, value, sha=None, phash=None, generation=None):
+        """Store a response under whichever hashes are available"""
+        if not self.enabled or (generation is not None and generation != self.generation):
+            return
+        if sha is not None:
+            self._put("sha:" + sha, value)
+        if phash is not None and self.use_perceptual:
+            self._put("phash:" + phash, value)
+
+    def clear(self):
+        """Drop all entries (e.g. after the model changes); counters are kept"""
+        self._entries.clear()
+        self.generation += 1
+
+    def stats(self):
+        lookups = self.hits + self.perceptual_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "perceptual": self.use_perceptual,
+            "hits": self.hits,
+            "perceptual_hits": self.perceptual_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.perceptual_hits) / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,107 @@
+"""
+Fast Image Preprocessing for the Classifier API
+Reduced-resolution JPEG decoding and low-copy conversion to normalized tensors
+"""
+
+import io
+import threading
+import time
+import warnings
+
+import numpy as np
+import torch
+from PIL import Image
+
+from classifier import IMG_SIZE, NORMALIZE_MEAN, NORMALIZE_STD
+
+STAGES = ("decode", "resize", "tensor")
+
+# PIL exposes pixels as a read-only buffer; the uint8 view is never written to
+# (the float conversion makes the copy), so the zero-copy wrap is safe
+warnings.filterwarnings("ignore", message="The given NumPy array is not writable")
+
+
+class Preprocessor:
+    """
+    Turns raw image bytes into the normalized (3, H, W) float tensor the model expects.
+
+    Built once and shared by all workers. For JPEGs, `Image.draft` asks libjpeg
+    to decode at 1/2, 1/4 or 1/8 scale, the smallest that still covers the target
+    size, so a 12MP phone photo never gets fully decoded. Other formats are
+    decoded normally and shrunk with `reducing_gap`. Normalization is folded into
+    a single multiply-add on the tensor.
+    """
+
+    def __init__(self, size=IMG_SIZE, mean=NORMALIZE_MEAN, std=NORMALIZE_STD, use_draft=True):
+        self.size = (size, size)
+        self.use_draft = use_draft
+        self._scale = torch.tensor([1.0 / (255.0 * s) for s in std]).view(3, 1, 1)
+        self._bias = torch.tensor([-m / s for m, s in zip(mean, std)]).view(3, 1, 1)
+        self._lock = threading.Lock()
+        self._totals = {stage: 0.0 for stage in STAGES}
+        self._count = 0
+        self._drafted = 0
+
+    def decode(self, contents):
+        """Decode bytes (or a seekable binary file) to an RGB image at (close to) the target resolution"""
+        image = Image.open(contents if hasattr(contents, "read") else io.BytesIO(contents))
+        drafted = False
+        if self.use_draft and image.format == "JPEG":
+            full_size = image.size
+            image.draft("RGB", self.size)
+            drafted = image.size != full_size
+        return image.convert("RGB"), drafted
+
+    def resize(self, image):
+        return image.resize(self.size, Image.BILINEAR, reducing_gap=3.0)
+
+    def to_tensor(self, image):
+        """HWC uint8 image -> normalized CHW float32 tensor with a single float copy"""
+        array = np.asarray(image)
+        tensor = torch.from_numpy(array).permute(2, 0, 1)
+        tensor = tensor.to(torch.float32, memory_format=torch.contiguous_format)
+        return tensor.mul_(self._scale).add_(self._bias)
+
+    def to_batch(self, images):
+        """Stack HWC uint8 images/arrays into one normalized NCHW float32 batch"""
+        array = np.stack([np.asarray(image) for image in images])
+        batch = torch.from_numpy(array).permute(0, 3, 1, 2)
+        batch = batch.to(torch.float32, memory_format=torch.contiguous_format)
+        return batch.mul_(self._scale).add_(self._bias)
+
+    def __call__(self, contents, phash_fn=None):
+        """
+        Preprocess raw bytes.
+
+        Returns (tensor, phash, timings) where phash is `phash_fn(decoded_image)`
+        if given and timings maps each stage to seconds.
+        """
+        start = time.perf_counter()
+        image, drafted = self.decode(contents)
+        phash = phash_fn(image) if phash_fn is not None else None
+        decoded = time.perf_counter()
+        image = self.resize(image)
+        resized = time.perf_counter()
+        tensor = self.to_tensor(image)
+        done = time.perf_counter()
+
+        timings = {"decode": decoded - start, "resize": resized - decoded, "tensor": done - resized}
+        with self._lock:
+            for stage, seconds in timings.items():
+                self._totals[stage] += seconds
+            self._count += 1
+            self._drafted += drafted
+        return tensor, phash, timings
+
+    def stats(self):
+        """Mean per-stage timings in milliseconds since startup"""
+        with self._lock:
+            count = self._count
+            return {
+                "images": count,
+                "draft_decoded": self._drafted,
+                "mean_ms": {
+                    stage: round(1000.0 * total / count, 3) if count else 0.0
+                    for stage, total in self._totals.items()
+                }
+            }
@@ -3,29 +3,250 @@ Quick Start Script for ML Classification Service
 Starts the FastAPI server for civic issue image classification
 """
 
-import uvicorn
+import argparse
 import os
+import signal
+import socket
+import sys
+import time
 
-if __name__ == "__main__":
+import uvicorn
+
+# Backends whose loaded model is safe to inherit across fork(); ONNX Runtime
+# sessions own native thread pools and are loaded by each worker instead
+FORK_SAFE_BACKENDS = ("eager", "torchscript", "quantized", "student")
+
+
+def check_model():
     # Check if model exists (PyTorch .pth format)
     model_path = "model/civic_classifier.pth"
     best_model_path = "model/civic_classifier_best.pth"
-    
+
     if not os.path.exists(model_path) and not os.path.exists(best_model_path):
         print("⚠️  No trained model found!")
         print("📝 Please run 'python train.py' first to train the model.")
         print("   This will download the dataset and train the classifier.")
-        exit(1)
-    
-    print("🚀 Starting Urban Issues Classifier API...")
-    print("📍 API will be available at http://localhost:8001")
-    print("📖 API docs at http://localhost:8001/docs")
-    print("")
-    
+        sys.exit(1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the Urban Issues Classifier API")
+    parser.add_argument("--production", action="store_true",
+                        help="Pre-fork worker processes sharing one copy of the model (no auto-reload)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes in production mode (default: one per core)")
+    parser.add_argument("--pin-cpus", action="store_true",
+                        help="Give each worker a disjoint set of cores with sched_setaffinity")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--memory-report-interval", type=float, default=60.0,
+                        help="Seconds between per-worker memory reports (0 disables)")
+    return parser.parse_args()
+
+
+def run_dev(args):
     uvicorn.run(
         "api:app",
-        host="0.0.0.0",
-        port=8001,
+        host=args.host,
+        port=args.port,
         reload=True,
-        log_level="info"
+        log_level=args.log_level
     )
+
+
+def worker_cpus(worker_id, workers):
+    """Disjoint slice of the available cores for one worker"""
+    cpus = sorted(os.sched_getaffinity(0))
+    per_worker = max(1, len(cpus) // workers)
+    start = (worker_id * per_worker) % len(cpus)
+    return set(cpus[start:start + per_worker])
+
+
+def configure_threads(args):
+    """
+    Split the cores between workers before api.py reads its thread settings.
+
+    Each worker runs ML_INFERENCE_WORKERS pool threads, each with
+    ML_TORCH_THREADS intra-op threads; explicit env values win.
+    """
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    per_worker = max(1, cores // args.workers)
+    pool_threads = max(1, min(int(os.getenv("ML_INFERENCE_WORKERS", "2")), per_worker))
+    os.environ.setdefault("ML_INFERENCE_WORKERS", str(pool_threads))
+    os.environ.setdefault("ML_TORCH_THREADS", str(max(1, per_worker // pool_threads)))
+
+
+def preload_model():
+    """
+    Load the model once in the parent so forked workers share its weights.
+
+    Parameters are moved to shared memory, so every worker maps the same
+    pages instead of holding a private copy. Torch runs single-threaded here
+    so no intra-op thread pool exists at fork time; each worker warms up with
+    its own threads in the startup event.
+    """
+    import torch
+    import api
+
+    if api.MODEL_BACKEND not in FORK_SAFE_BACKENDS:
+        print(f"ℹ️ Backend '{api.MODEL_BACKEND}' is loaded by each worker")
+        return
+    if api.DEVICE.type == "cuda":
+        # A CUDA context does not survive fork(), so workers load onto the GPU themselves
+        print("ℹ️ CUDA models are loaded by each worker")
+        return
+    torch.set_num_threads(1)
+    api.load_model_and_mappings()
+    slot = api.model_slots.active
+    if slot is None:
+        return
+    api.PRELOADED = True
+    for module in {id(m): m for m in (slot.model, slot.embedder, slot.fast_model) if isinstance(m, torch.nn.Module)}.values():
+        module.share_memory()
+    print(f"📦 Model {slot.version} preloaded into shared memory")
+
+
+def run_worker(worker_id, sock, args):
+    """Child process: serve the pre-bound socket until told to stop"""
+    os.environ["ML_WORKER_ID"] = str(worker_id)
+    import api
+    api.WORKER_ID = str(worker_id)
+    if args.pin_cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, worker_cpus(worker_id, args.workers))
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, signal.SIG_DFL)
+    config = uvicorn.Config(api.app, log_level=args.log_level, timeout_graceful_shutdown=30)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def report_memory(workers):
+    from metrics import read_process_memory
+
+    total_pss = 0
+    for pid, worker_id in sorted(workers.items(), key=lambda item: item[1]):
+        memory = read_process_memory(pid)
+        if memory is None:
+            return
+        total_pss += memory["pss"]
+        print(f"  🧠 worker {worker_id} (pid {pid}): RSS {memory['rss'] / 2**20:.0f} MB | "
+              f"PSS {memory['pss'] / 2**20:.0f} MB | shared {memory['shared'] / 2**20:.0f} MB")
+    print(f"  🧠 {len(workers)} workers use {total_pss / 2**20:.0f} MB in total (sum of PSS)")
+
+
+def run_production(args):
+    """
+    Pre-fork server: bind once, load the model once, fork N uvicorn workers.
+
+    The parent supervises the workers, restarts any that die and forwards
+    SIGINT/SIGTERM for a graceful shutdown. POST /reload only reaches one
+    worker; SIGHUP reloads the model in the parent and then replaces the
+    workers one at a time so all of them serve the new version.
+    """
+    configure_threads(args)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    preload_model()
+
+    workers = {}
+    stopping = False
+    reload_requested = False
+
+    def spawn(worker_id):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(worker_id, sock, args)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        workers[pid] = worker_id
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def request_reload(signum, frame):
+        nonlocal reload_requested
+        reload_requested = True
+
+    def reload_workers():
+        """Reload the shared model, then restart workers one by one so the rest keep serving"""
+        import api
+
+        previous = api.model_version()
+        preload_model()
+        if api.PRELOADED and api.model_version() == previous:
+            print(f"❌ Reload failed, workers keep model {previous}: {api.model_slots.last_error}")
+            return
+        # Workers forked from here would otherwise inherit the old weights too
+        api.model_slots.previous = None
+        for pid, worker_id in list(workers.items()):
+            if stopping:
+                return
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            os.waitpid(pid, 0)
+            del workers[pid]
+            spawn(worker_id)
+        print(f"🔄 {len(workers)} workers restarted on model {api.model_version() or 'loaded per worker'}")
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, request_reload)
+
+    for worker_id in range(args.workers):
+        spawn(worker_id)
+    print(f"🚀 {args.workers} workers serving on http://{args.host}:{args.port} "
+          f"({os.environ['ML_TORCH_THREADS']} torch threads x {os.environ['ML_INFERENCE_WORKERS']} pool threads each)")
+
+    next_report = time.monotonic() + min(args.memory_report_interval, 15.0)
+    while workers:
+        if reload_requested and not stopping:
+            reload_requested = False
+            reload_workers()
+            continue
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if args.memory_report_interval > 0 and not stopping and time.monotonic() >= next_report:
+                report_memory(workers)
+                next_report = time.monotonic() + args.memory_report_interval
+            time.sleep(0.5)
+            continue
+        worker_id = workers.pop(pid, None)
+        if worker_id is not None and not stopping:
+            print(f"⚠️ Worker {worker_id} (pid {pid}) exited with status {status}, restarting")
+            time.sleep(1.0)
+            spawn(worker_id)
+    sock.close()
+    print("👋 All workers stopped")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    check_model()
+
+    print("🚀 Starting Urban Issues Classifier API...")
+    print(f"📍 API will be available at http://localhost:{args.port}")
+    print(f"📖 API docs at http://localhost:{args.port}/docs")
+    print("")
+
+    if args.production:
+        run_production(args)
+    else:
+        run_dev(args)
@@ -0,0 +1,128 @@
+"""
+Compact Student Models for Knowledge Distillation
+MobileNetV3 students and channel-pruned copies of the ResNet-18 teacher, plus the
+distillation loss used to train them in train.py
+"""
+
+import copy
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+STUDENT_ARCHS = ("mobilenet_v3_large", "mobilenet_v3_small", "resnet18_pruned")
+
+
+def build_student(arch, num_classes, teacher, keep_ratio=0.5, pretrained=True):
+    """
+    Untrained student for `arch`.
+
+    MobileNetV3 students start from ImageNet weights (when `pretrained`) with
+    a new classifier layer; `resnet18_pruned` is a copy of the teacher with
+    `keep_ratio` of its channels kept (see prune_resnet).
+    """
+    if arch not in STUDENT_ARCHS:
+        raise ValueError(f"Unknown student '{arch}', expected one of {STUDENT_ARCHS}")
+    if arch == "resnet18_pruned":
+        return prune_resnet(copy.deepcopy(teacher), keep_ratio)
+
+    from torchvision import models
+    weights = {
+        "mobilenet_v3_large": models.MobileNet_V3_Large_Weights.DEFAULT,
+        "mobilenet_v3_small": models.MobileNet_V3_Small_Weights.DEFAULT,
+    }[arch] if pretrained else None
+    model = getattr(models, arch)(weights=weights)
+    model.classifier[-1] = nn.Linear(model.classifier[-1].in_features, num_classes)
+    return model
+
+
+def _top_channels(scores, keep_ratio):
+    """Indices (in original order) of the highest-scoring channels"""
+    keep = max(1, int(round(len(scores) * keep_ratio)))
+    return torch.argsort(scores, descending=True)[:keep].sort().values
+
+
+def _slice_conv(conv, out_idx, in_idx):
+    weight = conv.weight.detach()[out_idx][:, in_idx]
+    sliced = nn.Conv2d(len(in_idx), len(out_idx), conv.kernel_size, conv.stride, conv.padding,
+                       bias=conv.bias is not None)
+    sliced.weight.data.copy_(weight)
+    if conv.bias is not None:
+        sliced.bias.data.copy_(conv.bias.detach()[out_idx])
+    return sliced
+
+
+def _slice_bn(bn, idx):
+    sliced = nn.BatchNorm2d(len(idx), eps=bn.eps, momentum=bn.momentum)
+    for name in ("weight", "bias", "running_mean", "running_var"):
+        getattr(sliced, name).data.copy_(getattr(bn, name).detach()[idx])
+    return sliced
+
+
+def prune_resnet(model, keep_ratio):
+    """
+    Structured channel pruning of a CivicIssueClassifier, in place.
+
+    Channels are ranked by the magnitude of their BatchNorm scale (network
+    slimming). Channels inside a block are chosen per block; the residual
+    stream of each stage is chosen once, summing the scales of every layer
+    that writes to it, so identity shortcuts still line up. The pruned
+    layers keep the teacher's weights for the surviving channels.
+    """
+    net = model.backbone
+    stages = [net.layer1, net.layer2, net.layer3, net.layer4]
+    streams = []
+    for position, layer in enumerate(stages):
+        norms = [block.bn2 for block in layer]
+        norms += [block.downsample[1] for block in layer if block.downsample is not None]
+        if position == 0:
+            # layer1 has no downsample, so it shares its stream with the stem
+            norms.append(net.bn1)
+        streams.append(_top_channels(sum(bn.weight.detach().abs() for bn in norms), keep_ratio))
+
+    all_inputs = torch.arange(net.conv1.in_channels)
+    net.conv1 = _slice_conv(net.conv1, streams[0], all_inputs)
+    net.bn1 = _slice_bn(net.bn1, streams[0])
+    in_idx = streams[0]
+    for layer, out_idx in zip(stages, streams):
+        for block in layer:
+            mid_idx = _top_channels(block.bn1.weight.detach().abs(), keep_ratio)
+            block.conv1 = _slice_conv(block.conv1, mid_idx, in_idx)
+            block.bn1 = _slice_bn(block.bn1, mid_idx)
+            block.conv2 = _slice_conv(block.conv2, out_idx, mid_idx)
+            block.bn2 = _slice_bn(block.bn2, out_idx)
+            if block.downsample is not None:
+                block.downsample[0] = _slice_conv(block.downsample[0], out_idx, in_idx)
+                block.downsample[1] = _slice_bn(block.downsample[1], out_idx)
+            in_idx = out_idx
+
+    # The head's first Linear reads the pooled stream of the last stage
+    for position, module in enumerate(net.fc):
+        if isinstance(module, nn.Linear):
+            sliced = nn.Linear(len(in_idx), module.out_features)
+            sliced.weight.data.copy_(module.weight.detach()[:, in_idx])
+            sliced.bias.data.copy_(module.bias.detach())
+            net.fc[position] = sliced
+            break
+    return model
+
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature=4.0, alpha=0.7):
+    """
+    Hinton et al. knowledge-distillation loss.
+
+    `alpha` weights the KL divergence to the teacher's temperature-softened
+    distribution (scaled by T^2 so its gradients match the hard loss); the
+    rest is cross-entropy on the true labels.
+    """
+    soft = F.kl_div(
+        F.log_softmax(student_logits / temperature, dim=1),
+        F.log_softmax(teacher_logits / temperature, dim=1),
+        reduction="batchmean",
+        log_target=True
+    ) * temperature ** 2
+    return alpha * soft + (1.0 - alpha) * F.cross_entropy(student_logits, labels)
+
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
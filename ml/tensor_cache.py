@@ -0,0 +1,161 @@
+"""
+Pre-decoded Training Image Cache
+Decodes and resizes the dataset once into a memory-mapped uint8 array so
+training epochs read pixels instead of re-decoding JPEGs
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+from torchvision import transforms
+
+from classifier import IMG_SIZE, NORMALIZE_MEAN, NORMALIZE_STD
+
+IMAGES_FILE = "images.u8"
+LABELS_FILE = "labels.npy"
+INDEX_FILE = "index.json"
+CACHE_VERSION = 1
+
+
+def source_fingerprint(samples, size):
+    """Hash of every source path, size and mtime plus the target size"""
+    digest = hashlib.sha256(f"v{CACHE_VERSION}:{size}".encode())
+    for path, label in samples:
+        stat = os.stat(path)
+        digest.update(f"{path}\0{label}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def _load_resized(path, size):
+    image = Image.open(path)
+    image.draft("RGB", (size, size))
+    image = image.convert("RGB").resize((size, size), Image.BILINEAR)
+    return np.asarray(image, dtype=np.uint8)
+
+
+def _decode_chunk(task):
+    """Worker: decode a chunk of images straight into the shared memmap"""
+    images_path, total, size, start, paths = task
+    images = np.memmap(images_path, dtype=np.uint8, mode="r+", shape=(total, size, size, 3))
+    for offset, path in enumerate(paths):
+        images[start + offset] = _load_resized(path, size)
+    images.flush()
+    return len(paths)
+
+
+def build_tensor_cache(samples, cache_dir, size=IMG_SIZE, num_workers=None, chunk_size=256):
+    """
+    Decode `samples` [(path, label), ...] into `cache_dir` unless an up-to-date cache exists.
+
+    Writes an (N, size, size, 3) uint8 memmap, an int64 label array and an
+    index.json with the source fingerprint. Returns the cache directory.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, INDEX_FILE)
+    fingerprint = source_fingerprint(samples, size)
+
+    if os.path.exists(index_path):
+        with open(index_path, "r") as f:
+            index = json.load(f)
+        if index.get("fingerprint") == fingerprint:
+            print(f"✅ Reusing tensor cache at {cache_dir} ({index['num_samples']} images)")
+            return cache_dir
+        print("🔄 Dataset changed, rebuilding tensor cache...")
+        os.remove(index_path)
+
+    total = len(samples)
+    images_path = os.path.join(cache_dir, IMAGES_FILE)
+    images = np.memmap(images_path, dtype=np.uint8, mode="w+", shape=(total, size, size, 3))
+    del images
+
+    print(f"🧊 Building tensor cache for {total} images at {size}x{size}...")
+    paths = [path for path, _ in samples]
+    tasks = [
+        (images_path, total, size, start, paths[start:start + chunk_size])
+        for start in range(0, total, chunk_size)
+    ]
+    done = 0
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        for count in pool.map(_decode_chunk, tasks):
+            done += count
+            print(f"  Cached {done}/{total} images")
+
+    np.save(os.path.join(cache_dir, LABELS_FILE), np.array([label for _, label in samples], dtype=np.int64))
+    # The index is written last, so an interrupted build is never mistaken for a valid cache
+    with open(index_path, "w") as f:
+        json.dump({
+            "version": CACHE_VERSION,
+            "fingerprint": fingerprint,
+            "num_samples": total,
+            "size": size,
+            "paths": paths,
+        }, f)
+    print(f"✅ Tensor cache saved to {cache_dir}")
+    return cache_dir
+
+
+class CachedImageDataset(Dataset):
+    """
+    Dataset over a tensor cache.
+
+    Items are zero-copy CHW uint8 views of the memmap; `transform` runs on
+    tensors (flip, rotation, color jitter all accept uint8 tensors). The memmap
+    is opened lazily so each DataLoader worker maps the file itself.
+    """
+
+    def __init__(self, cache_dir, transform=None):
+        self.cache_dir = cache_dir
+        self.transform = transform
+        with open(os.path.join(cache_dir, INDEX_FILE), "r") as f:
+            index = json.load(f)
+        self.size = index["size"]
+        self.num_samples = index["num_samples"]
+        self.labels = np.load(os.path.join(cache_dir, LABELS_FILE))
+        self._images = None
+
+    def __len__(self):
+        return self.num_samples
+
+    @property
+    def images(self):
+        if self._images is None:
+            # Copy-on-write mapping: writable views without touching the file
+            self._images = np.memmap(
+                os.path.join(self.cache_dir, IMAGES_FILE), dtype=np.uint8, mode="c",
+                shape=(self.num_samples, self.size, self.size, 3)
+            )
+        return self._images
+
+    def __getitem__(self, idx):
+        image = torch.from_numpy(self.images[idx]).permute(2, 0, 1)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, int(self.labels[idx])
+
+    def __getstate__(self):
+        # Don't pickle the mapping into DataLoader workers
+        state = self.__dict__.copy()
+        state["_images"] = None
+        return state
+
+
+def get_tensor_transforms():
+    """Train/val transforms that operate on cached uint8 CHW tensors"""
+    to_normalized = [
+        transforms.ConvertImageDtype(torch.float32),
+        transforms.Normalize(mean=NORMALIZE_MEAN, std=NORMALIZE_STD),
+    ]
+    train_transform = transforms.Compose([
+        transforms.RandomHorizontalFlip(),
+        transforms.RandomRotation(15),
+        transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2),
+        *to_normalized,
+    ])
+    val_transform = transforms.Compose(to_normalized)
+    return train_transform, val_transform
@@ -5,20 +5,41 @@ Uses the Kaggle urban-issues-dataset for training a CNN model with PyTorch
 
 import os
 import json
+import time
+import argparse
 import kagglehub
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import DataLoader
-from torchvision import datasets, transforms, models
+from torch.utils.data import DataLoader, Subset
+from torchvision import transforms, models
 from PIL import Image
 import numpy as np
 
+from tensor_cache import CachedImageDataset, build_tensor_cache, get_tensor_transforms
+from feature_cache import build_feature_cache, module_fingerprint, train_head
+from manifest import ManifestDataset, build_manifest, stratified_split
+from checkpoint import EarlyStopping, atomic_save, load_checkpoint, save_checkpoint
+from classifier import BACKEND_ARTIFACTS, build_classifier, find_weights_path
+from student import STUDENT_ARCHS, build_student, count_parameters, distillation_loss
+
 # Configuration
 IMG_SIZE = 224
 BATCH_SIZE = 32
 EPOCHS = 15
 LEARNING_RATE = 0.001
+VAL_SPLIT = 0.2
+SPLIT_SEED = 42
+TENSOR_CACHE_DIR = "cache/tensors"
+FEATURE_CACHE_DIR = "cache/features"
+HEAD_EPOCHS = 30
+LR_PATIENCE = 3
+EARLY_STOPPING_PATIENCE = 2 * LR_PATIENCE
+CHECKPOINT_PATH = "cache/checkpoints/last.pt"
+MANIFEST_PATH = "cache/manifest.json"
+DISTILL_TEMPERATURE = 4.0
+DISTILL_ALPHA = 0.7
+STUDENT_REPORT_PATH = "model/student_report.json"
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 # Category mapping - maps dataset folder names to standardized categories
@@ -124,12 +145,126 @@ def get_data_transforms():
     return train_transform, val_transform
 
 
-def train_model():
+def build_class_mappings(class_to_idx):
+    """Build the class_mappings.json content (categories, departments, priorities) for the dataset folders"""
+    idx_to_class = {v: k for k, v in class_to_idx.items()}
+    
+    index_to_category = {}
+    for folder_name, index in class_to_idx.items():
+        category = CATEGORY_MAPPING.get(folder_name, folder_name.upper().replace(" ", "_"))
+        index_to_category[index] = {
+            "category": category,
+            "original_name": folder_name,
+            "department": DEPARTMENT_MAPPING.get(category, "General Municipal Department"),
+            "priority": PRIORITY_MAPPING.get(category, "medium")
+        }
+        print(f"  {index}: {folder_name} -> {category}")
+    
+    return {
+        "class_to_idx": class_to_idx,
+        "idx_to_class": idx_to_class,
+        "index_to_category": {str(k): v for k, v in index_to_category.items()},
+        "category_mapping": CATEGORY_MAPPING,
+        "department_mapping": DEPARTMENT_MAPPING,
+        "priority_mapping": PRIORITY_MAPPING,
+        "num_classes": len(class_to_idx)
+    }
+
+
+def save_class_mappings(mappings):
+    os.makedirs("model", exist_ok=True)
+    with open("model/class_mappings.json", "w") as f:
+        json.dump(mappings, f, indent=2)
+    print("\n✅ Class mappings saved to model/class_mappings.json")
+
+
+def load_dataset(dataset_path, manifest_path=MANIFEST_PATH, transform=None):
+    """Dataset over the (incrementally updated) manifest instead of an ImageFolder directory walk"""
+    return ManifestDataset(build_manifest(dataset_path, manifest_path), transform)
+
+
+def split_dataset(full_dataset):
+    """Stratified (train_indices, val_indices) with a fixed seed so other tools can rebuild the same split"""
+    return stratified_split(full_dataset.targets, VAL_SPLIT, SPLIT_SEED)
+
+
+def parse_args(argv=None):
+    """Command line options for train.py"""
+    parser = argparse.ArgumentParser(description="Train the civic issue classifier")
+    parser.add_argument("--dataset", help="Dataset root (default: Kaggle download/cache)")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="Dataset index, rebuilt incrementally")
+    parser.add_argument("--tensor-cache", action="store_true",
+                        help="Decode images once into a memory-mapped cache and train from it")
+    parser.add_argument("--cache-dir", default=TENSOR_CACHE_DIR, help="Tensor cache location")
+    parser.add_argument("--cache-workers", type=int, default=None,
+                        help="Processes used to build the tensor cache (default: all cores)")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH,
+                        help="Full training state written atomically after every epoch")
+    parser.add_argument("--resume", action="store_true", help="Continue from --checkpoint if it exists")
+    parser.add_argument("--early-stopping-patience", type=int, default=EARLY_STOPPING_PATIENCE,
+                        help="Stop after this many epochs without val loss improvement (0 disables)")
+    
+    # Head-only retraining on cached frozen-backbone features
+    parser.add_argument("--head-only", action="store_true",
+                        help="Freeze the backbone, cache its features and retrain only backbone.fc")
+    parser.add_argument("--backbone-weights",
+                        help="Weights for the frozen backbone (default: existing trained model, else ImageNet)")
+    parser.add_argument("--feature-cache-dir", default=FEATURE_CACHE_DIR)
+    parser.add_argument("--head-epochs", type=int, default=HEAD_EPOCHS)
+    
+    # Knowledge distillation into a smaller student, served with ML_MODEL_BACKEND=student
+    parser.add_argument("--distill", action="store_true",
+                        help="Distill the trained model into a smaller student using the tensor cache")
+    parser.add_argument("--student", choices=STUDENT_ARCHS, default="mobilenet_v3_large")
+    parser.add_argument("--keep-ratio", type=float, default=0.5,
+                        help="Fraction of channels resnet18_pruned keeps in every layer")
+    parser.add_argument("--teacher-weights", help="Teacher weights (default: existing trained model)")
+    parser.add_argument("--temperature", type=float, default=DISTILL_TEMPERATURE,
+                        help="Softmax temperature for the teacher's soft targets")
+    parser.add_argument("--alpha", type=float, default=DISTILL_ALPHA,
+                        help="Weight of the soft-target loss against the hard-label loss")
+    
+    # High-throughput training options; --fast turns on workers, bf16 and channels_last
+    parser.add_argument("--fast", action="store_true",
+                        help="Shorthand for --num-workers <cores> --amp --channels-last")
+    parser.add_argument("--num-workers", type=int, default=0, help="DataLoader worker processes")
+    parser.add_argument("--prefetch-factor", type=int, default=4,
+                        help="Batches prefetched per DataLoader worker")
+    parser.add_argument("--amp", action="store_true", help="bfloat16 autocast for forward/loss")
+    parser.add_argument("--channels-last", action="store_true", help="channels_last memory format")
+    parser.add_argument("--compile", action="store_true", help="Wrap the model in torch.compile")
+    
+    options = parser.parse_args(argv)
+    if options.fast:
+        options.num_workers = options.num_workers or (os.cpu_count() or 1)
+        options.amp = True
+        options.channels_last = True
+    return options
+
+
+def make_loader(dataset, shuffle, options):
+    """DataLoader with persistent, prefetching workers and pinned memory when enabled"""
+    loader_kwargs = {}
+    if options.num_workers > 0:
+        loader_kwargs = {"persistent_workers": True, "prefetch_factor": options.prefetch_factor}
+    return DataLoader(
+        dataset,
+        batch_size=BATCH_SIZE,
+        shuffle=shuffle,
+        num_workers=options.num_workers,
+        pin_memory=DEVICE.type == "cuda",
+        **loader_kwargs
+    )
+
+
+def train_model(options=None):
     """Main training function"""
+    options = options or parse_args([])
     print(f"🖥️ Using device: {DEVICE}")
     
     # Download dataset
-    dataset_path = download_dataset()
+    dataset_path = options.dataset or download_dataset()
     
     # Get transforms
     train_transform, val_transform = get_data_transforms()
@@ -137,86 +272,92 @@ def train_model():
     print(f"\n📂 Loading data from: {dataset_path}")
     
     # Load full dataset to get class info
-    full_dataset = datasets.ImageFolder(dataset_path, transform=train_transform)
+    full_dataset = load_dataset(dataset_path, options.manifest)
     class_names = full_dataset.classes
     num_classes = len(class_names)
     
     print(f"\n📊 Found {num_classes} classes:")
     
     # Create class mappings
-    class_to_idx = full_dataset.class_to_idx
-    idx_to_class = {v: k for k, v in class_to_idx.items()}
-    
-    index_to_category = {}
-    for folder_name, index in class_to_idx.items():
-        category = CATEGORY_MAPPING.get(folder_name, folder_name.upper().replace(" ", "_"))
-        index_to_category[index] = {
-            "category": category,
-            "original_name": folder_name,
-            "department": DEPARTMENT_MAPPING.get(category, "General Municipal Department"),
-            "priority": PRIORITY_MAPPING.get(category, "medium")
-        }
-        print(f"  {index}: {folder_name} -> {category}")
+    mappings = build_class_mappings(full_dataset.class_to_idx)
     
-    # Split dataset
-    train_size = int(0.8 * len(full_dataset))
-    val_size = len(full_dataset) - train_size
-    train_dataset, val_dataset = torch.utils.data.random_split(
-        full_dataset, [train_size, val_size]
-    )
+    # Split dataset; each split gets its own transform
+    train_idx, val_idx = split_dataset(full_dataset)
+    train_size, val_size = len(train_idx), len(val_idx)
     
-    # Apply different transform to validation set
-    val_dataset.dataset.transform = val_transform
+    if options.tensor_cache:
+        # Train from pre-decoded pixels
+        cache_dir = build_tensor_cache(full_dataset.samples, options.cache_dir, num_workers=options.cache_workers)
+        train_tensor_transform, val_tensor_transform = get_tensor_transforms()
+        train_dataset = Subset(CachedImageDataset(cache_dir, train_tensor_transform), train_idx)
+        val_dataset = Subset(CachedImageDataset(cache_dir, val_tensor_transform), val_idx)
+    else:
+        train_dataset = full_dataset.subset(train_idx, train_transform)
+        val_dataset = full_dataset.subset(val_idx, val_transform)
     
     # Create data loaders
-    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, num_workers=0)
-    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=0)
+    train_loader = make_loader(train_dataset, True, options)
+    val_loader = make_loader(val_dataset, False, options)
     
     print(f"\n📈 Dataset split: {train_size} training, {val_size} validation")
     
     # Save class mappings
-    os.makedirs("model", exist_ok=True)
-    
-    mappings = {
-        "class_to_idx": class_to_idx,
-        "idx_to_class": idx_to_class,
-        "index_to_category": {str(k): v for k, v in index_to_category.items()},
-        "category_mapping": CATEGORY_MAPPING,
-        "department_mapping": DEPARTMENT_MAPPING,
-        "priority_mapping": PRIORITY_MAPPING,
-        "num_classes": num_classes
-    }
-    
-    with open("model/class_mappings.json", "w") as f:
-        json.dump(mappings, f, indent=2)
-    print("\n✅ Class mappings saved to model/class_mappings.json")
+    save_class_mappings(mappings)
     
     # Create model
     model = CivicIssueClassifier(num_classes).to(DEVICE)
+    memory_format = torch.channels_last if options.channels_last else torch.contiguous_format
+    model = model.to(memory_format=memory_format)
+    # Forward passes go through the compiled wrapper; weights are saved from `model`
+    forward_model = torch.compile(model) if options.compile else model
+    autocast_dtype = torch.bfloat16
+    
+    print(f"\n⚙️ Workers: {options.num_workers} | bf16 autocast: {options.amp} | "
+          f"channels_last: {options.channels_last} | torch.compile: {options.compile}")
     
     # Loss and optimizer
     criterion = nn.CrossEntropyLoss()
     optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE)
-    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', patience=3, factor=0.5)
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', patience=LR_PATIENCE, factor=0.5)
+    early_stopping = EarlyStopping(scheduler, options.early_stopping_patience)
     
     # Training loop
-    print("\n🚀 Starting training...")
     best_val_acc = 0.0
-    history = {"train_loss": [], "train_acc": [], "val_loss": [], "val_acc": []}
+    history = {
+        "train_loss": [], "train_acc": [], "val_loss": [], "val_acc": [],
+        "train_images_per_sec": [], "val_images_per_sec": []
+    }
+    epochs = options.epochs
+    start_epoch = 0
+    
+    if options.resume and os.path.exists(options.checkpoint):
+        start_epoch, history, best_val_acc, extra = load_checkpoint(
+            options.checkpoint, model, optimizer, scheduler, early_stopping
+        )
+        if extra.get("class_to_idx") != full_dataset.class_to_idx:
+            raise ValueError(f"Checkpoint {options.checkpoint} was trained on different classes")
+        print(f"\n♻️ Resuming from {options.checkpoint} at epoch {start_epoch+1}/{epochs}")
+    elif options.resume:
+        print(f"\n⚠️ No checkpoint at {options.checkpoint}, starting from scratch")
     
-    for epoch in range(EPOCHS):
+    print("\n🚀 Starting training...")
+    
+    for epoch in range(start_epoch, epochs):
         # Training phase
         model.train()
         train_loss = 0.0
         train_correct = 0
         train_total = 0
+        train_start = time.perf_counter()
         
         for batch_idx, (inputs, labels) in enumerate(train_loader):
-            inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
+            inputs = inputs.to(DEVICE, non_blocking=True, memory_format=memory_format)
+            labels = labels.to(DEVICE, non_blocking=True)
             
-            optimizer.zero_grad()
-            outputs = model(inputs)
-            loss = criterion(outputs, labels)
+            optimizer.zero_grad(set_to_none=True)
+            with torch.autocast(device_type=DEVICE.type, dtype=autocast_dtype, enabled=options.amp):
+                outputs = forward_model(inputs)
+                loss = criterion(outputs, labels)
             loss.backward()
             optimizer.step()
             
@@ -226,21 +367,24 @@ def train_model():
             train_correct += predicted.eq(labels).sum().item()
             
             if (batch_idx + 1) % 50 == 0:
-                print(f"  Epoch {epoch+1}/{EPOCHS} - Batch {batch_idx+1}/{len(train_loader)} - Loss: {loss.item():.4f}")
+                print(f"  Epoch {epoch+1}/{epochs} - Batch {batch_idx+1}/{len(train_loader)} - Loss: {loss.item():.4f}")
         
         train_loss /= len(train_loader)
         train_acc = 100.0 * train_correct / train_total
+        train_ips = train_total / (time.perf_counter() - train_start)
         
         # Validation phase
         model.eval()
         val_loss = 0.0
         val_correct = 0
         val_total = 0
+        val_start = time.perf_counter()
         
-        with torch.no_grad():
+        with torch.no_grad(), torch.autocast(device_type=DEVICE.type, dtype=autocast_dtype, enabled=options.amp):
             for inputs, labels in val_loader:
-                inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
-                outputs = model(inputs)
+                inputs = inputs.to(DEVICE, non_blocking=True, memory_format=memory_format)
+                labels = labels.to(DEVICE, non_blocking=True)
+                outputs = forward_model(inputs)
                 loss = criterion(outputs, labels)
                 
                 val_loss += loss.item()
@@ -250,26 +394,41 @@ def train_model():
         
         val_loss /= len(val_loader)
         val_acc = 100.0 * val_correct / val_total
+        val_ips = val_total / (time.perf_counter() - val_start)
         
         # Update learning rate
         scheduler.step(val_loss)
+        should_stop = early_stopping.step()
         
         # Save history
         history["train_loss"].append(train_loss)
         history["train_acc"].append(train_acc)
         history["val_loss"].append(val_loss)
         history["val_acc"].append(val_acc)
+        history["train_images_per_sec"].append(train_ips)
+        history["val_images_per_sec"].append(val_ips)
         
-        print(f"Epoch {epoch+1}/{EPOCHS}: Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}% | Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}%")
+        print(f"Epoch {epoch+1}/{epochs}: Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}% | Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}%")
+        print(f"  ⚡ Throughput: {train_ips:.1f} train img/s | {val_ips:.1f} val img/s")
         
         # Save best model
         if val_acc > best_val_acc:
             best_val_acc = val_acc
-            torch.save(model.state_dict(), "model/civic_classifier_best.pth")
+            atomic_save(model.state_dict(), "model/civic_classifier_best.pth")
             print(f"  ✅ New best model saved! Val Acc: {val_acc:.2f}%")
+        
+        save_checkpoint(
+            options.checkpoint, model, optimizer, scheduler, epoch, history, best_val_acc, early_stopping,
+            extra={"class_to_idx": full_dataset.class_to_idx}
+        )
+        
+        if should_stop:
+            print(f"\n⏹️ Early stopping: no val loss improvement for {early_stopping.bad_epochs} epochs")
+            history["stopped_early_at_epoch"] = epoch + 1
+            break
     
     # Save final model
-    torch.save(model.state_dict(), "model/civic_classifier.pth")
+    atomic_save(model.state_dict(), "model/civic_classifier.pth")
     print("\n✅ Final model saved to model/civic_classifier.pth")
     
     # Save training history
@@ -282,5 +441,265 @@ def train_model():
     return model, history
 
 
+def load_backbone_weights(model, weights_path):
+    """Load every backbone weight except backbone.fc, so the class count may differ"""
+    state_dict = torch.load(weights_path, map_location="cpu")
+    backbone_state = {k: v for k, v in state_dict.items() if not k.startswith("backbone.fc.")}
+    missing, unexpected = model.load_state_dict(backbone_state, strict=False)
+    if unexpected or any(not k.startswith("backbone.fc.") for k in missing):
+        raise RuntimeError(f"Incompatible backbone weights in {weights_path}")
+
+
+def train_head_only(options=None):
+    """
+    Retrain only the classifier head on cached frozen-backbone features.
+    
+    Useful when categories are added or relabelled: the backbone runs once
+    over the dataset, then the head trains in seconds. The saved state_dict
+    has the same keys as a full fine-tune, so api.py loads it unchanged.
+    """
+    options = options or parse_args(["--head-only"])
+    print(f"🖥️ Using device: {DEVICE}")
+    dataset_path = options.dataset or download_dataset()
+    _, val_transform = get_data_transforms()
+    full_dataset = load_dataset(dataset_path, options.manifest, val_transform)
+    num_classes = len(full_dataset.classes)
+    print(f"\n📊 Found {num_classes} classes:")
+    mappings = build_class_mappings(full_dataset.class_to_idx)
+    
+    # Frozen backbone: fine-tuned weights if available, else ImageNet
+    weights_path = options.backbone_weights
+    if weights_path is None:
+        for candidate in ("model/civic_classifier_best.pth", "model/civic_classifier.pth"):
+            if os.path.exists(candidate):
+                weights_path = candidate
+                break
+    model = CivicIssueClassifier(num_classes)
+    if weights_path:
+        load_backbone_weights(model, weights_path)
+    print(f"\n🧊 Backbone weights: {weights_path or 'ImageNet'}")
+    head = model.backbone.fc
+    model.backbone.fc = nn.Identity()
+    backbone = model.to(DEVICE)
+    
+    # Features are extracted without augmentation, optionally from the tensor cache
+    if options.tensor_cache:
+        cache_dir = build_tensor_cache(full_dataset.samples, options.cache_dir, num_workers=options.cache_workers)
+        _, val_tensor_transform = get_tensor_transforms()
+        feature_dataset = CachedImageDataset(cache_dir, val_tensor_transform)
+    else:
+        feature_dataset = full_dataset
+    # Keyed by backbone contents and image contents, so rewriting the weights
+    # file with a new head or relabelling images keeps the cached features
+    fingerprint = f"{IMG_SIZE}:{module_fingerprint(model.backbone)}"
+    features = build_feature_cache(
+        options.feature_cache_dir, fingerprint, full_dataset.hashes, backbone,
+        make_loader(feature_dataset, False, options), DEVICE
+    )
+    labels = np.array(full_dataset.targets, dtype=np.int64)
+    
+    train_idx, val_idx = (np.array(indices) for indices in split_dataset(full_dataset))
+    print(f"\n📈 Dataset split: {len(train_idx)} training, {len(val_idx)} validation")
+    
+    print("\n🚀 Training classifier head...")
+    head_state, history = train_head(
+        head, features[train_idx], labels[train_idx], features[val_idx], labels[val_idx],
+        DEVICE, epochs=options.head_epochs
+    )
+    
+    # Reassemble a full model state_dict with the original key layout
+    model.backbone.fc = head
+    model.backbone.fc.load_state_dict(head_state)
+    state_dict = {k: v.cpu() for k, v in model.state_dict().items()}
+    save_class_mappings(mappings)
+    atomic_save(state_dict, "model/civic_classifier_best.pth")
+    atomic_save(state_dict, "model/civic_classifier.pth")
+    print("✅ Model saved to model/civic_classifier_best.pth and model/civic_classifier.pth")
+    
+    history["head_only"] = True
+    with open("model/training_history.json", "w") as f:
+        json.dump(history, f, indent=2)
+    print(f"\n📊 Best Validation Accuracy: {max(history['val_acc']):.2f}%")
+    return model, history
+
+
+def predict_logits(model, loader, memory_format=torch.contiguous_format):
+    """Logits and labels for every batch of `loader`, on the CPU"""
+    model.eval()
+    logits, labels = [], []
+    with torch.no_grad():
+        for inputs, targets in loader:
+            logits.append(model(inputs.to(DEVICE, memory_format=memory_format)).float().cpu())
+            labels.append(targets)
+    return torch.cat(logits), torch.cat(labels)
+
+
+def freeze_model(model, example):
+    """Traced, frozen TorchScript copy of `model` for serving"""
+    model.eval()
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(model, example))
+
+
+def measure_latency(model, inputs, repeats=5):
+    """Median milliseconds per image for a forward pass over the batch `inputs`"""
+    times = []
+    with torch.no_grad():
+        model(inputs)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(inputs)
+            times.append(time.perf_counter() - start)
+    return 1000.0 * float(np.median(times)) / len(inputs)
+
+
+def distill_student(options=None):
+    """
+    Distill the trained classifier into a smaller student.
+    
+    The teacher runs alongside the student on the same augmented batches from
+    the tensor cache, and the student learns its softened outputs plus the
+    true labels. The best student by validation accuracy is saved as frozen
+    TorchScript at the `student` backend path, so api.py serves it with
+    ML_MODEL_BACKEND=student; its accuracy, agreement and speed relative to
+    the teacher go to model/student_report.json.
+    """
+    options = options or parse_args(["--distill"])
+    print(f"🖥️ Using device: {DEVICE}")
+    dataset_path = options.dataset or download_dataset()
+    full_dataset = load_dataset(dataset_path, options.manifest)
+    num_classes = len(full_dataset.classes)
+    
+    teacher_path = options.teacher_weights or find_weights_path()
+    if not os.path.exists(teacher_path):
+        raise FileNotFoundError(f"No teacher weights at {teacher_path}, train the model first")
+    teacher = build_classifier(teacher_path, num_classes, DEVICE)
+    student = build_student(options.student, num_classes, teacher, options.keep_ratio).to(DEVICE)
+    memory_format = torch.channels_last if options.channels_last else torch.contiguous_format
+    teacher = teacher.to(memory_format=memory_format)
+    student = student.to(memory_format=memory_format)
+    print(f"\n🎓 Teacher {teacher_path}: {count_parameters(teacher) / 1e6:.1f}M parameters")
+    print(f"🧒 Student {options.student}: {count_parameters(student) / 1e6:.1f}M parameters")
+    
+    # Pre-decoded pixels: the teacher and student both read every batch
+    cache_dir = build_tensor_cache(full_dataset.samples, options.cache_dir, num_workers=options.cache_workers)
+    train_tensor_transform, val_tensor_transform = get_tensor_transforms()
+    train_idx, val_idx = split_dataset(full_dataset)
+    train_loader = make_loader(Subset(CachedImageDataset(cache_dir, train_tensor_transform), train_idx), True, options)
+    val_loader = make_loader(Subset(CachedImageDataset(cache_dir, val_tensor_transform), val_idx), False, options)
+    print(f"\n📈 Dataset split: {len(train_idx)} training, {len(val_idx)} validation")
+    
+    # The teacher is frozen, so its validation predictions are computed once
+    teacher_logits, val_labels = predict_logits(teacher, val_loader, memory_format)
+    teacher_preds = teacher_logits.argmax(dim=1)
+    teacher_acc = 100.0 * teacher_preds.eq(val_labels).float().mean().item()
+    print(f"🎓 Teacher validation accuracy: {teacher_acc:.2f}%")
+    
+    optimizer = optim.Adam(student.parameters(), lr=LEARNING_RATE)
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', patience=LR_PATIENCE, factor=0.5)
+    early_stopping = EarlyStopping(scheduler, options.early_stopping_patience)
+    history = {"train_loss": [], "train_acc": [], "val_loss": [], "val_acc": [], "agreement": []}
+    best_val_acc, best_state = -1.0, None
+    
+    print(f"\n🚀 Distilling for up to {options.epochs} epochs (T={options.temperature}, alpha={options.alpha})...")
+    for epoch in range(options.epochs):
+        student.train()
+        train_loss, train_correct, train_total = 0.0, 0, 0
+        for inputs, labels in train_loader:
+            inputs = inputs.to(DEVICE, non_blocking=True, memory_format=memory_format)
+            labels = labels.to(DEVICE, non_blocking=True)
+            optimizer.zero_grad(set_to_none=True)
+            with torch.autocast(device_type=DEVICE.type, dtype=torch.bfloat16, enabled=options.amp):
+                with torch.no_grad():
+                    soft_targets = teacher(inputs)
+                outputs = student(inputs)
+            loss = distillation_loss(outputs.float(), soft_targets.float(), labels, options.temperature, options.alpha)
+            loss.backward()
+            optimizer.step()
+            train_loss += loss.item()
+            train_total += labels.size(0)
+            train_correct += outputs.argmax(dim=1).eq(labels).sum().item()
+        
+        student_logits, _ = predict_logits(student, val_loader, memory_format)
+        val_loss = nn.functional.cross_entropy(student_logits, val_labels).item()
+        student_preds = student_logits.argmax(dim=1)
+        val_acc = 100.0 * student_preds.eq(val_labels).float().mean().item()
+        agreement = 100.0 * student_preds.eq(teacher_preds).float().mean().item()
+        scheduler.step(val_loss)
+        should_stop = early_stopping.step()
+        
+        history["train_loss"].append(train_loss / len(train_loader))
+        history["train_acc"].append(100.0 * train_correct / train_total)
+        history["val_loss"].append(val_loss)
+        history["val_acc"].append(val_acc)
+        history["agreement"].append(agreement)
+        print(f"Epoch {epoch+1}/{options.epochs}: Distill Loss: {history['train_loss'][-1]:.4f} | "
+              f"Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}% | agrees with teacher on {agreement:.2f}%")
+        
+        if val_acc > best_val_acc:
+            best_val_acc = val_acc
+            best_state = {k: v.detach().clone() for k, v in student.state_dict().items()}
+        if should_stop:
+            print(f"\n⏹️ Early stopping: no val loss improvement for {early_stopping.bad_epochs} epochs")
+            history["stopped_early_at_epoch"] = epoch + 1
+            break
+    
+    if best_state is None:
+        raise RuntimeError("No distillation epoch produced a valid student (no epochs run or "
+                           "validation accuracy was NaN); nothing was saved")
+    
+    # Serve the best epoch as frozen TorchScript, written atomically
+    student.load_state_dict(best_state)
+    student.eval()
+    example = next(iter(val_loader))[0].to(DEVICE, memory_format=memory_format)
+    scripted = freeze_model(student, example[:1])
+    student_path = BACKEND_ARTIFACTS["student"]
+    scripted.save(student_path + ".tmp")
+    os.replace(student_path + ".tmp", student_path)
+    print(f"\n✅ Student saved to {student_path} (serve it with ML_MODEL_BACKEND=student)")
+    
+    # Both models are timed as frozen TorchScript, so the speedup reflects model size alone
+    teacher_ms = measure_latency(freeze_model(teacher, example[:1]), example)
+    student_ms = measure_latency(scripted, example)
+    best_epoch = history["val_acc"].index(best_val_acc)
+    report = {
+        "student": options.student,
+        "keep_ratio": options.keep_ratio if options.student == "resnet18_pruned" else None,
+        "temperature": options.temperature,
+        "alpha": options.alpha,
+        "num_samples": len(val_labels),
+        "teacher": {
+            "path": teacher_path,
+            "parameters": count_parameters(teacher),
+            "val_acc": teacher_acc,
+            "ms_per_image": teacher_ms,
+        },
+        "distilled": {
+            "path": student_path,
+            "parameters": count_parameters(student),
+            "val_acc": best_val_acc,
+            "accuracy_delta": best_val_acc - teacher_acc,
+            "agreement": history["agreement"][best_epoch],
+            "ms_per_image": student_ms,
+            "speedup": teacher_ms / student_ms if student_ms > 0 else 0.0,
+        },
+        "history": history,
+    }
+    with open(STUDENT_REPORT_PATH, "w") as f:
+        json.dump(report, f, indent=2)
+    
+    print(f"\n📊 Teacher: {teacher_acc:.2f}% | {teacher_ms:.2f} ms/img")
+    print(f"📊 Student: {best_val_acc:.2f}% ({best_val_acc - teacher_acc:+.2f}) | {student_ms:.2f} ms/img "
+          f"({report['distilled']['speedup']:.1f}x faster)")
+    print(f"✅ Report saved to {STUDENT_REPORT_PATH}")
+    return student, report
+
+
 if __name__ == "__main__":
-    train_model()
+    options = parse_args()
+    if options.head_only:
+        train_head_only(options)
+    elif options.distill:
+        distill_student(options)
+    else:
+        train_model(options)
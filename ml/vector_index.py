@@ -0,0 +1,299 @@
+"""
+In-Memory Vector Index for Near-Duplicate Detection
+Unit-normalized embeddings in a memory-mapped float32 matrix with an
+append-only metadata log, searched by brute-force cosine similarity
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+VECTORS_FILE = "vectors.f32"
+LOG_FILE = "entries.jsonl"
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+INITIAL_CAPACITY = 1024
+NO_DISTRICT = -1
+REMOVED = -2
+
+
+def lock_file(f):
+    """Block until this process holds the exclusive lock on the open file `f`"""
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+    # msvcrt locks a byte range from the current position; byte 0 is the lock
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            time.sleep(0.01)
+
+
+def unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def normalize(vectors):
+    """L2-normalize rows (or a single vector) so dot products are cosine similarities"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorIndex:
+    """
+    Top-k cosine search over embeddings keyed by report id.
+
+    Vectors live in `index_dir/vectors.f32`, grown by doubling; ids and
+    districts are appended to `entries.jsonl` after the vector is written, so
+    the log never references a missing row. Replacing an id rewrites its row
+    in place. Search is a single matrix-vector product, which is fast enough
+    for a few hundred thousand reports and needs no external service.
+
+    Several server processes may share one index: writes hold an exclusive
+    file lock, and every call first replays log lines appended by others.
+    """
+
+    def __init__(self, index_dir, dim=512):
+        self.index_dir = index_dir
+        self.dim = dim
+        self.model_id = None
+        self._lock = threading.Lock()
+        self._ids = []
+        self._row_of = {}
+        self._districts = {}
+        self._district_names = []
+        self._codes = np.empty(0, dtype=np.int32)
+        self._vectors = None
+        self._log_offset = 0
+        os.makedirs(index_dir, exist_ok=True)
+        self._load()
+
+    # --- persistence -------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _load(self):
+        meta_path = self._path(META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            if meta["dim"] != self.dim:
+                raise ValueError(f"Index at {self.index_dir} has dim {meta['dim']}, expected {self.dim}")
+            self.model_id = meta.get("model_id")
+        self._sync()
+
+    def _sync(self):
+        """Apply log lines written since the last call (by this or another process)"""
+        log_path = self._path(LOG_FILE)
+        size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        entries = []
+        if size > self._log_offset:
+            with open(log_path, "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read(size - self._log_offset)
+            # Only complete lines; a torn tail is picked up once it is finished
+            data = data[:data.rfind(b"\n") + 1]
+            self._log_offset += len(data)
+            entries = [json.loads(line) for line in data.splitlines() if line.strip()]
+        rows = max([len(self._ids)] + [entry["row"] + 1 for entry in entries])
+        self._ensure_capacity(rows)
+        self._ids.extend([None] * (rows - len(self._ids)))
+        for entry in entries:
+            self._set_row_meta(entry["row"], entry["id"], entry.get("district"))
+
+    def _ensure_capacity(self, rows):
+        """Map at least `rows` rows, following growth done by other processes"""
+        capacity = INITIAL_CAPACITY
+        if os.path.exists(self._path(VECTORS_FILE)):
+            capacity = max(capacity, os.path.getsize(self._path(VECTORS_FILE)) // (4 * self.dim))
+        capacity = max(capacity, rows)
+        if self._vectors is not None and self._vectors.shape[0] >= capacity:
+            return
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        self._open_vectors(capacity)
+        codes = np.full(capacity, REMOVED, dtype=np.int32)
+        codes[:len(self._codes)] = self._codes
+        self._codes = codes
+
+    @contextmanager
+    def _write_lock(self):
+        """Thread lock plus exclusive file lock, with the log replayed inside"""
+        with self._lock:
+            with open(self._path(LOCK_FILE), "a+") as f:
+                lock_file(f)
+                try:
+                    self._sync()
+                    yield
+                finally:
+                    unlock_file(f)
+
+    def _open_vectors(self, capacity):
+        path = self._path(VECTORS_FILE)
+        mode = "r+" if os.path.exists(path) else "w+"
+        if mode == "r+" and os.path.getsize(path) < capacity * 4 * self.dim:
+            with open(path, "r+b") as f:
+                f.truncate(capacity * 4 * self.dim)
+        self._vectors = np.memmap(path, dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+
+    def _append_log(self, entry):
+        with open(self._path(LOG_FILE), "ab") as f:
+            f.write((json.dumps(entry) + "\n").encode())
+            # Under the write lock nobody else appends, so this is our own line
+            self._log_offset = f.tell()
+
+    def _write_meta(self):
+        tmp_path = self._path(META_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "model_id": self.model_id}, f)
+        os.replace(tmp_path, self._path(META_FILE))
+
+    def flush(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+
+    # --- metadata ----------------------------------------------------------
+
+    def _district_code(self, district):
+        if district is None:
+            return NO_DISTRICT
+        code = self._districts.get(district)
+        if code is None:
+            code = self._districts[district] = len(self._district_names)
+            self._district_names.append(district)
+        return code
+
+    def _set_row_meta(self, row, item_id, district):
+        previous = self._ids[row]
+        if previous is not None and self._row_of.get(previous) == row:
+            del self._row_of[previous]
+        self._ids[row] = item_id
+        if item_id is None:
+            self._codes[row] = REMOVED
+        else:
+            self._row_of[item_id] = row
+            self._codes[row] = self._district_code(district)
+
+    # --- public API --------------------------------------------------------
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def add(self, item_id, vector, district=None, model_id=None):
+        """Insert or replace `item_id`; `vector` is normalized before storing"""
+        item_id = str(item_id)
+        vector = normalize(vector).reshape(self.dim)
+        with self._write_lock():
+            if model_id is not None and model_id != self.model_id:
+                if self.model_id is not None:
+                    print(f"⚠️ Vector index {self.index_dir} mixes embeddings from different model weights")
+                self.model_id = model_id
+                self._write_meta()
+            elif not os.path.exists(self._path(META_FILE)):
+                self._write_meta()
+            row = self._row_of.get(item_id)
+            if row is None:
+                row = len(self._ids)
+                if row >= self._vectors.shape[0]:
+                    self._ensure_capacity(2 * self._vectors.shape[0])
+                self._ids.append(None)
+            self._vectors[row] = vector
+            self._append_log({"row": row, "id": item_id, "district": district})
+            self._set_row_meta(row, item_id, district)
+
+    def remove(self, item_id):
+        """Drop `item_id` from search results; returns False if it was not indexed"""
+        item_id = str(item_id)
+        with self._write_lock():
+            row = self._row_of.get(item_id)
+            if row is None:
+                return False
+            self._append_log({"row": row, "id": None})
+            self._set_row_meta(row, None, None)
+            return True
+
+    def get(self, item_id):
+        with self._lock:
+            self._sync()
+            row = self._row_of.get(str(item_id))
+            return None if row is None else np.array(self._vectors[row])
+
+    def search(self, vector, k=5, district=None, exclude_id=None, min_similarity=None):
+        """
+        Top-k most similar items as [{"id", "district", "similarity"}], best first.
+
+        `district` restricts results to that district; `exclude_id` drops one
+        id (e.g. the query itself).
+        """
+        query = normalize(vector).reshape(self.dim)
+        with self._lock:
+            self._sync()
+            rows = len(self._ids)
+            if rows == 0 or k <= 0:
+                return []
+            codes = self._codes[:rows]
+            if district is not None:
+                if district not in self._districts:
+                    return []
+                mask = codes == self._districts[district]
+            else:
+                mask = codes != REMOVED
+            if exclude_id is not None and str(exclude_id) in self._row_of:
+                mask[self._row_of[str(exclude_id)]] = False
+            candidates = np.flatnonzero(mask)
+            if len(candidates) == 0:
+                return []
+            if len(candidates) == rows:
+                scores = self._vectors[:rows] @ query
+            else:
+                scores = self._vectors[candidates] @ query
+            k = min(k, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results = []
+            for position in top:
+                score = float(scores[position])
+                if min_similarity is not None and score < min_similarity:
+                    break
+                row = int(candidates[position])
+                code = int(codes[row])
+                results.append({
+                    "id": self._ids[row],
+                    "district": self._district_names[code] if code >= 0 else None,
+                    "similarity": round(score, 4),
+                })
+            return results
+
+    def stats(self):
+        with self._lock:
+            self._sync()
+            return {
+                "items": len(self._row_of),
+                "rows": len(self._ids),
+                "capacity": int(self._vectors.shape[0]),
+                "dim": self.dim,
+                "districts": len(self._district_names),
+                "model_id": self.model_id,
+                "path": self.index_dir,
+            }